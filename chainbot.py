@@ -10,6 +10,14 @@ import re
 import os
 import configparser
 import binascii
+import shutil
+import io
+import signal
+import time
+import functools
+import random
+import datetime
+import itertools
 
 import jsonpatch
 import fire
@@ -19,23 +27,121 @@ from nacl.encoding import HexEncoder
 
 
 class SigningKey:
+    '''Key material of a seed, derived once at construction'''
     def __init__(self, seed):
         self._seed = seed
         self._sk = nacl.signing.SigningKey(seed, HexEncoder)
+        vk = bytes(self._sk.verify_key)
+        self._priv_key_base64 = base64.b64encode(self._sk._signing_key).decode()
+        self._pub_key_base64 = base64.b64encode(vk).decode()
+        self._validator_address = hashlib.sha256(vk).hexdigest()[:40].upper()
 
     def priv_key_base64(self):
-        return base64.b64encode(self._sk._signing_key).decode()
+        return self._priv_key_base64
 
     def pub_key_base64(self):
-        vk = self._sk.verify_key
-        return base64.b64encode(bytes(vk)).decode()
+        return self._pub_key_base64
 
     def validator_address(self):
-        vk = self._sk.verify_key
-        return hashlib.sha256(bytes(vk)).hexdigest()[:40].upper()
+        return self._validator_address
 
 
-def tendermint_cfg(moniker, app_port, rpc_port, p2p_port, peers):
+@functools.lru_cache(maxsize=None)
+def signing_key(seed):
+    '''registry of key material shared by the whole prepare pipeline'''
+    return SigningKey(seed)
+
+
+class JsonCache:
+    '''Json values stored under a directory, one file per key.
+
+    Keys are sha256 digests of the inputs, so the inputs themselves (mnemonics
+    for example) are never written to disk.
+    '''
+    def __init__(self, path, refresh=False):
+        self._path = Path(path)
+        self._refresh = refresh
+
+    @staticmethod
+    def key(*inputs):
+        data = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key):
+        if self._refresh:
+            return None
+        try:
+            with open(self._path / Path(key + '.json')) as fp:
+                return json.load(fp)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, value):
+        if not self._path.exists():
+            os.makedirs(self._path, exist_ok=True)
+        path = self._path / Path(key + '.json')
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w') as fp:
+            json.dump(value, fp)
+        os.replace(tmp, path)
+
+
+class Manifest:
+    '''Fingerprints of the generated files, stored in <root_path>/.cache/manifest.json.
+
+    In incremental mode a file is only rewritten if its fingerprint differs
+    from the previous run, or if it doesn't exist.
+    '''
+    def __init__(self, root_path, incremental=False):
+        self._root_path = Path(root_path)
+        self._path = self._root_path / Path('.cache') / Path('manifest.json')
+        self._previous = {}
+        self._entries = {}
+        if incremental:
+            try:
+                with open(self._path) as fp:
+                    self._previous = json.load(fp)
+            except (FileNotFoundError, ValueError):
+                pass
+
+    def write(self, path, content, inputs=''):
+        '''write content to path unless unchanged, returns True if written
+        :param inputs: Extra data the file depends on besides its content.'''
+        key = str(path.relative_to(self._root_path))
+        fingerprint = hashlib.sha256((inputs + content).encode()).hexdigest()
+        self._entries[key] = fingerprint
+        if self._previous.get(key) == fingerprint and path.exists():
+            return False
+        with open(path, 'w') as fp:
+            fp.write(content)
+        return True
+
+    def link(self, src, path):
+        '''hard link path to src written before, or copy it if linking is not possible,
+        returns True if (re)linked'''
+        key = str(path.relative_to(self._root_path))
+        fingerprint = self._entries[str(src.relative_to(self._root_path))]
+        self._entries[key] = fingerprint
+        if self._previous.get(key) == fingerprint and path.exists():
+            return False
+        if path.exists():
+            path.unlink()
+        try:
+            os.link(src, path)
+        except OSError:
+            shutil.copyfile(src, path)
+        return True
+
+    def save(self):
+        if not self._path.parent.exists():
+            os.makedirs(self._path.parent, exist_ok=True)
+        with open(self._path, 'w') as fp:
+            json.dump(self._entries, fp, indent=4, sort_keys=True)
+
+
+def tendermint_cfg(moniker, app_port, rpc_port, p2p_port, peers,
+                   max_inbound=40, max_outbound=10,
+                   prometheus_port=26660, prometheus=False):
     return {
         'proxy_app': 'tcp://127.0.0.1:%d' % app_port,
         'moniker': moniker,
@@ -88,8 +194,8 @@ def tendermint_cfg(moniker, app_port, rpc_port, p2p_port, peers):
             'upnp': False,
             'addr_book_file': 'config/addrbook.json',
             'addr_book_strict': False,
-            'max_num_inbound_peers': 40,
-            'max_num_outbound_peers': 10,
+            'max_num_inbound_peers': max_inbound,
+            'max_num_outbound_peers': max_outbound,
             'flush_throttle_timeout': '100ms',
             'max_packet_msg_payload_size': 1024,
             'send_rate': 5120000,
@@ -132,8 +238,8 @@ def tendermint_cfg(moniker, app_port, rpc_port, p2p_port, peers):
             'index_all_tags': True
         },
         'instrumentation': {
-            'prometheus': False,
-            'prometheus_listen_addr': ':26660',
+            'prometheus': prometheus,
+            'prometheus_listen_addr': ':%d' % prometheus_port,
             'max_open_connections': 3,
             'namespace': 'tendermint'
         }
@@ -141,7 +247,7 @@ def tendermint_cfg(moniker, app_port, rpc_port, p2p_port, peers):
 
 
 def priv_validator_key(seed):
-    sk = SigningKey(seed)
+    sk = signing_key(seed)
     return {
         'address': sk.validator_address(),
         'pub_key': {
@@ -156,7 +262,7 @@ def priv_validator_key(seed):
 
 
 def node_key(seed):
-    sk = SigningKey(seed)
+    sk = signing_key(seed)
     return {
         'priv_key': {
             'type': 'tendermint/PrivKeyEd25519',
@@ -191,7 +297,7 @@ def app_state_cfg(cfg):
                 '%s@example.com' % node['name'],
                 {
                     'consensus_pubkey_type': 'Ed25519',
-                    'consensus_pubkey_b64': SigningKey(node['validator_seed']).pub_key_base64(),
+                    'consensus_pubkey_b64': signing_key(node['validator_seed']).pub_key_base64(),
                 }
             ]
             for node in cfg['nodes']
@@ -200,7 +306,8 @@ def app_state_cfg(cfg):
     }
 
 
-def programs(node, app_hash, root_path, cfg):
+def node_commands(node, app_hash, root_path, cfg):
+    '''(name, command) of the processes of a node, in dependency order'''
     node_path = root_path / Path(node['name'])
     base_port = node['base_port']
     chain_abci_port = base_port + 8
@@ -213,7 +320,11 @@ def programs(node, app_hash, root_path, cfg):
         ('tendermint', f'''tendermint node --home={node_path / Path('tendermint')}'''),
         ('client-rpc', f'''client-rpc --port={client_rpc_port} --chain-id={cfg['chain_id']} --storage-dir={node_path / Path('wallet')} --websocket-url=ws://127.0.0.1:{tendermint_rpc_port}/websocket'''),
     ]
+    return commands
 
+
+def programs(node, app_hash, root_path, cfg):
+    commands = node_commands(node, app_hash, root_path, cfg)
     return {
         'program:%s-%s' % (name, node['name']): {
             'command': cmd,
@@ -289,12 +400,227 @@ async def interact(cmd, input=None, **kwargs):
     return stdout
 
 
-async def gen_app_state(cfg):
+async def spawn(cmd, log_path, **kwargs):
+    '''start a long running process in its own process group, output appended to log_path'''
+    with open(log_path, 'ab') as log:
+        return await asyncio.create_subprocess_shell(
+            cmd, stdout=log, stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True, **kwargs
+        )
+
+
+async def probe_tcp(port, host='127.0.0.1'):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        return False
+    writer.close()
+    return True
+
+
+async def http_get(port, path, host='127.0.0.1'):
+    '''body of a plain http GET'''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f'GET {path} HTTP/1.0\r\nHost: {host}\r\n\r\n'.encode())
+        data = await reader.read()
+    finally:
+        writer.close()
+    return data.split(b'\r\n\r\n', 1)[1]
+
+
+async def http_get_json(port, path, host='127.0.0.1'):
+    return json.loads(await http_get(port, path, host))
+
+
+async def tendermint_height(port):
+    '''latest block height of the tendermint rpc, None if not reachable yet'''
+    try:
+        status = await http_get_json(port, '/status')
+    except (OSError, ValueError, IndexError):
+        return None
+    return int(status['result']['sync_info']['latest_block_height'])
+
+
+async def wait_until(probe, proc=None, timeout=60, interval=0.1):
+    '''poll probe until it returns a true value'''
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while True:
+        if proc is not None and proc.returncode is not None:
+            raise RuntimeError('process exited with %d' % proc.returncode)
+        result = await probe()
+        if result:
+            return result
+        if loop.time() > deadline:
+            raise TimeoutError('not ready after %ss' % timeout)
+        await asyncio.sleep(interval)
+
+
+def readiness_probes(node):
+    '''probe of each process of node_commands, see Port Usage in README'''
+    base_port = node['base_port']
+
+    async def tendermint():
+        return await tendermint_height(base_port + 7) is not None
+
+    return {
+        'tx-enclave': lambda: probe_tcp(base_port),
+        'chain-abci': lambda: probe_tcp(base_port + 8),
+        'tendermint': tendermint,
+        'client-rpc': lambda: probe_tcp(base_port + 1),
+    }
+
+
+async def start_node(node, app_hash, root_path, cfg, procs, timeout):
+    '''start the processes of a node one after another once the previous is ready,
+    returns seconds since start when each became ready'''
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    probes = readiness_probes(node)
+    timings = {}
+    env = dict(os.environ, RUST_BACKTRACE='1', RUST_LOG='info')
+    for name, cmd in node_commands(node, app_hash, root_path, cfg):
+        spawning = asyncio.ensure_future(
+            spawn(cmd, root_path / Path('logs') / Path(f"{name}-{node['name']}.log"), env=env))
+        try:
+            proc = await asyncio.shield(spawning)
+        except asyncio.CancelledError:
+            # the process may be started already, record it so it's stopped
+            procs.append(await spawning)
+            raise
+        procs.append(proc)
+        await wait_until(probes[name], proc, timeout)
+        timings[name] = round(loop.time() - start, 3)
+    return timings
+
+
+def stop_processes(procs):
+    for proc in procs:
+        if proc.returncode is None:
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+async def up_cluster(cfg, timeout=60, keep_running=True):
+    root_path = Path(cfg['root_path']).resolve()
+    with open(root_path / Path(cfg['nodes'][0]['name']) / Path('tendermint') /
+              Path('config') / Path('genesis.json')) as fp:
+        app_hash = json.load(fp)['app_hash']
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    procs = []
+    tasks = [
+        asyncio.ensure_future(start_node(node, app_hash, root_path, cfg, procs, timeout))
+        for node in cfg['nodes']
+    ]
+    try:
+        node_timings = await asyncio.gather(*tasks)
+        ready = loop.time() - start
+        await wait_until(lambda: first_block(cfg['nodes']), timeout=timeout)
+        report = {
+            'nodes': {node['name']: t for node, t in zip(cfg['nodes'], node_timings)},
+            'all_ready': round(ready, 3),
+            'first_block': round(loop.time() - start, 3),
+        }
+        print(json.dumps(report, indent=4), flush=True)
+        if keep_running:
+            await asyncio.gather(*(proc.wait() for proc in procs))
+    finally:
+        # when a node fails the others are still starting, stop them before their processes
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        stop_processes(procs)
+        await asyncio.gather(*(proc.wait() for proc in procs))
+
+
+async def first_block(nodes):
+    heights = await asyncio.gather(*(tendermint_height(node['base_port'] + 7) for node in nodes))
+    return any(h is not None and h >= 1 for h in heights)
+
+
+def binary_fingerprint(name):
+    'identify the installed binary by path, size and modification time'
+    path = shutil.which(name)
+    if path is None:
+        return None
+    st = os.stat(path)
+    return [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+
+
+def bulk_accounts(spec):
+    '''(address, amount) of the pre-funded accounts of the `accounts` spec entry, lazily
+    :param spec: {"count": n, "amount": a, "seed": s} or {"file": path, "amount": a},
+                 the file has one staking address per line.
+    '''
+    if not spec:
+        return
+    amount = str(spec['amount'])
+    if 'file' in spec:
+        with open(spec['file']) as fp:
+            for line in fp:
+                address = line.strip()
+                if address:
+                    yield address, amount
+    else:
+        seed = str(spec.get('seed', 0))
+        for i in range(spec['count']):
+            digest = hashlib.sha256(('%s:%d' % (seed, i)).encode()).hexdigest()
+            yield '0x' + digest[:40], amount
+
+
+def count_accounts(spec):
+    if not spec:
+        return 0
+    if 'file' not in spec:
+        return spec['count']
+    return sum(1 for _ in bulk_accounts(spec))
+
+
+def accounts_digest(spec):
+    '''fingerprint of the accounts source, including the content of the address file'''
+    if not spec:
+        return ''
+    h = hashlib.sha256(json.dumps(spec, sort_keys=True).encode())
+    if 'file' in spec:
+        with open(spec['file'], 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def write_app_state_cfg(fp, cfg, accounts=()):
+    '''serialize the dev-utils genesis config, appending accounts to the distribution
+    as they are generated'''
+    cfg = dict(cfg)
+    distribution = cfg.pop('distribution')
+    fp.write('{"distribution": {')
+    sep = ''
+    for address, amount in itertools.chain(distribution.items(), accounts):
+        fp.write('%s%s: %s' % (sep, json.dumps(address), json.dumps(amount)))
+        sep = ', '
+    fp.write('}')
+    for k, v in cfg.items():
+        fp.write(', %s: %s' % (json.dumps(k), json.dumps(v)))
+    fp.write('}')
+
+
+async def gen_app_state(cfg, cache=None, accounts=None):
+    key = JsonCache.key(cfg, accounts_digest(accounts), binary_fingerprint('dev-utils'))
+    state = cache.get(key) if cache else None
+    if state is not None:
+        return state
     with tempfile.NamedTemporaryFile('w') as fp:
-        json.dump(cfg, fp)
+        write_app_state_cfg(fp, cfg, bulk_accounts(accounts))
         fp.flush()
         result = await interact(f'dev-utils genesis generate -g "{fp.name}"')
-        return json.loads('{%s}' % result.decode('utf-8'))
+        state = json.loads('{%s}' % result.decode('utf-8'))
+    if cache:
+        cache.put(key, state)
+    return state
 
 
 async def gen_wallet_addr(mnemonic, type='Staking', count=1):
@@ -325,7 +651,7 @@ async def gen_wallet_addr(mnemonic, type='Staking', count=1):
         return addrs
 
 
-async def gen_genesis(cfg):
+async def gen_genesis(cfg, cache=None):
     genesis = {
         "genesis_time": cfg['genesis_time'],
         "chain_id": cfg['chain_id'],
@@ -346,10 +672,10 @@ async def gen_genesis(cfg):
         },
         'validators': [
             {
-                'address': SigningKey(node['validator_seed']).validator_address(),
+                'address': signing_key(node['validator_seed']).validator_address(),
                 'pub_key': {
                     'type': 'tendermint/PubKeyEd25519',
-                    'value': SigningKey(node['validator_seed']).pub_key_base64(),
+                    'value': signing_key(node['validator_seed']).pub_key_base64(),
                 },
                 'power': str(coin_to_voting_power(node['bonded_coin'])),
                 'name': node['name'],
@@ -359,7 +685,7 @@ async def gen_genesis(cfg):
     }
 
     patch = jsonpatch.JsonPatch(cfg['chain_config_patch'])
-    state = await gen_app_state(patch.apply(app_state_cfg(cfg)))
+    state = await gen_app_state(patch.apply(app_state_cfg(cfg)), cache, cfg.get('accounts'))
     genesis.update(state)
     return genesis
 
@@ -368,7 +694,7 @@ def gen_validators(cfgs):
     return [
         (
             cfg['staking'][0],
-            SigningKey(cfg['validator_seed']),
+            signing_key(cfg['validator_seed']),
             coin_to_voting_power(cfg['bonded_coin']),
             cfg['name'],
         )
@@ -386,23 +712,99 @@ def gen_distribution(nodes):
     return dist
 
 
-def gen_peers(cfgs):
-    return ','.join(
-        'tcp://%s@0.0.0.0:%d' % (
-            SigningKey(cfg['node_seed']).validator_address().lower(),
-            cfg['base_port'] + 6
-        )
-        for i, cfg in enumerate(cfgs)
+def random_regular_graph(count, degree, seed=0):
+    '''neighbours of each node in a random graph where every node has `degree` edges,
+    deterministic for the same seed'''
+    if count * degree % 2:
+        raise ValueError('count * degree must be even for a regular graph')
+    rng = random.Random(seed)
+    for _ in range(100):
+        stubs = [i for i in range(count) for _ in range(degree)]
+        rng.shuffle(stubs)
+        edges = set()
+        while stubs:
+            a = stubs.pop()
+            for j in range(len(stubs) - 1, -1, -1):
+                b = stubs[j]
+                if b != a and (min(a, b), max(a, b)) not in edges:
+                    break
+            else:
+                break
+            stubs.pop(j)
+            edges.add((min(a, b), max(a, b)))
+        else:
+            neighbours = [[] for _ in range(count)]
+            for a, b in sorted(edges):
+                neighbours[a].append(b)
+                neighbours[b].append(a)
+            return neighbours
+    raise ValueError('failed to generate a %d-regular graph of %d nodes' % (degree, count))
+
+
+def gen_topology(count, mode='mesh', degree=4, seed=0):
+    '''neighbours of each node index
+    :param mode: [mesh|ring|regular|hub]'''
+    if mode == 'mesh' or (mode == 'regular' and degree >= count - 1):
+        return [[j for j in range(count) if j != i] for i in range(count)]
+    elif mode == 'ring':
+        return [sorted({(i - 1) % count, (i + 1) % count} - {i}) for i in range(count)]
+    elif mode == 'regular':
+        return random_regular_graph(count, degree, seed)
+    elif mode == 'hub':
+        # node0 is the hub, the others find more peers through pex
+        return [list(range(1, count))] + [[0] for _ in range(1, count)]
+    raise ValueError('unknown topology: %s' % mode)
+
+
+def peer_address(cfg):
+    return 'tcp://%s@0.0.0.0:%d' % (
+        signing_key(cfg['node_seed']).validator_address().lower(),
+        cfg['base_port'] + 6
     )
 
 
-async def init_cluster(cfg):
-    await populate_wallet_addresses(cfg['nodes'])
+def gen_peers(cfgs, topology=None):
+    '''persistent peers and peer limits of each node
+    :param topology: {"mode": "mesh", "degree": 4, "seed": 0}'''
+    topology = topology or {}
+    mode = topology.get('mode', 'mesh')
+    degree = topology.get('degree', 4)
+    neighbours = gen_topology(len(cfgs), mode, degree, topology.get('seed', 0))
+    result = []
+    for i, peers in enumerate(neighbours):
+        max_peers = len(peers) if mode != 'hub' else max(len(peers), degree)
+        result.append({
+            'peers': ','.join(peer_address(cfgs[j]) for j in peers),
+            'max_inbound': max_peers,
+            'max_outbound': max_peers,
+        })
+    return result
 
-    peers = gen_peers(cfg['nodes'])
-    genesis = await gen_genesis(cfg)
-    app_hash = genesis['app_hash']
+
+async def init_cluster(cfg, concurrency=8, refresh_cache=False, incremental=False):
+    '''generate the cluster files, returns the names of nodes whose files are (re)written'''
     root_path = Path(cfg['root_path']).resolve()
+    cache_path = root_path / Path('.cache')
+    await populate_wallet_addresses(
+        cfg['nodes'], concurrency,
+        JsonCache(cache_path / Path('addresses'), refresh_cache)
+    )
+
+    peers = gen_peers(cfg['nodes'], cfg.get('p2p_topology'))
+    genesis = await gen_genesis(
+        cfg, JsonCache(cache_path / Path('genesis'), refresh_cache)
+    )
+    app_hash = genesis['app_hash']
+    genesis_json = json.dumps(genesis, indent=4)
+    genesis_digest = hashlib.sha256(genesis_json.encode()).hexdigest()
+    tendermint_patch = jsonpatch.JsonPatch(cfg['tendermint_config_patch'])
+    manifest = Manifest(root_path, incremental)
+    touched = []
+    # serialized once, every node links to the same file
+    root_genesis = root_path / Path('genesis.json')
+    if not root_path.exists():
+        os.makedirs(root_path)
+    manifest.write(root_genesis, genesis_json)
 
     for i, node in enumerate(cfg['nodes']):
         base_port = node['base_port']
@@ -410,45 +812,57 @@ async def init_cluster(cfg):
         cfg_path = root_path / Path(node_name) / Path('tendermint') / Path('config')
         if not cfg_path.exists():
             os.makedirs(cfg_path)
-
-        json.dump(genesis,
-                  open(cfg_path / Path('genesis.json'), 'w'),
-                  indent=4)
-        json.dump(node_key(node['node_seed']),
-                  open(cfg_path / Path('node_key.json'), 'w'),
-                  indent=4)
-        json.dump(node_key(node['validator_seed']),
-                  open(cfg_path / Path('priv_validator_key.json'), 'w'),
-                  indent=4)
-
-        patch = jsonpatch.JsonPatch(cfg['tendermint_config_patch'])
-        toml.dump(
-            patch.apply(
-                tendermint_cfg(
-                    node_name,
-                    base_port + (i * 10) + 8,
-                    base_port + (i * 10) + 7,
-                    base_port + (i * 10) + 6,
-                    peers
-                )
-            ),
-            open(cfg_path / Path('config.toml'), 'w')
-        )
-
         data_path = root_path / Path(node_name) / Path('tendermint') / Path('data')
         if not data_path.exists():
             data_path.mkdir()
-        json.dump({
-            "height": "0",
-            "round": "0",
-            "step": 0
-        }, open(data_path / Path('priv_validator_state.json'), 'w'))
+
+        written = [
+            manifest.link(root_genesis, cfg_path / Path('genesis.json')),
+            manifest.write(cfg_path / Path('node_key.json'),
+                           json.dumps(node_key(node['node_seed']), indent=4)),
+            manifest.write(cfg_path / Path('priv_validator_key.json'),
+                           json.dumps(node_key(node['validator_seed']), indent=4)),
+            manifest.write(
+                cfg_path / Path('config.toml'),
+                toml.dumps(
+                    tendermint_patch.apply(
+                        tendermint_cfg(
+                            node_name,
+                            base_port + 8,
+                            base_port + 7,
+                            base_port + 6,
+                            peers[i]['peers'],
+                            peers[i]['max_inbound'],
+                            peers[i]['max_outbound'],
+                            base_port + 9,
+                            cfg.get('prometheus', False),
+                        )
+                    )
+                )
+            ),
+            # tendermint updates the state file while running, only reset it
+            # when the chain or the validator key changes.
+            manifest.write(
+                data_path / Path('priv_validator_state.json'),
+                json.dumps({
+                    "height": "0",
+                    "round": "0",
+                    "step": 0
+                }),
+                inputs=genesis_digest + node['validator_seed']
+            ),
+        ]
+        if any(written):
+            touched.append(node_name)
 
     logs_path = root_path / Path('logs')
     if not logs_path.exists():
         logs_path.mkdir()
-    write_tasks_ini(open(root_path / Path('tasks.ini'), 'w'),
-                    tasks_ini(cfg['nodes'], app_hash, root_path, cfg))
+    ini = io.StringIO()
+    write_tasks_ini(ini, tasks_ini(cfg['nodes'], app_hash, root_path, cfg))
+    manifest.write(root_path / Path('tasks.ini'), ini.getvalue())
+    manifest.save()
+    return touched
 
 
 def gen_mnemonic():
@@ -460,23 +874,285 @@ def gen_seed():
     return binascii.hexlify(os.urandom(32)).decode()
 
 
-async def populate_wallet_addresses(nodes):
-    for node in nodes:
-        node['staking'] = await gen_wallet_addr(node['mnemonic'], type='Staking', count=2)
-        # node['transfer'] = await gen_wallet_addr(node['mnemonic'], type='Transfer', count=3)
+async def cached_wallet_addr(cache, mnemonic, type='Staking', count=1):
+    key = JsonCache.key(mnemonic, type, count)
+    addrs = cache.get(key) if cache else None
+    if addrs is None:
+        addrs = await gen_wallet_addr(mnemonic, type=type, count=count)
+        if cache:
+            cache.put(key, addrs)
+    return addrs
+
+
+async def populate_wallet_addresses(nodes, concurrency=8, cache=None):
+    'derive addresses of all nodes concurrently, at most `concurrency` wallets at a time'
+    sem = asyncio.Semaphore(concurrency)
+
+    async def populate(node):
+        async with sem:
+            node['staking'] = await cached_wallet_addr(cache, node['mnemonic'], type='Staking', count=2)
+            # node['transfer'] = await cached_wallet_addr(cache, node['mnemonic'], type='Transfer', count=3)
+
+    await asyncio.gather(*(populate(node) for node in nodes))
+
+
+PROMETHEUS_LINE_RE = re.compile(r'^(\w+)(?:\{[^}]*\})? (\S+)', re.M)
+METRICS_COLUMNS = ['time', 'height', 'mempool_size', 'block_interval', 'peers', 'rounds']
+
+
+def parse_prometheus(text, namespace='tendermint'):
+    '''samples of the prometheus text format, summed over the labels, without the namespace'''
+    samples = {}
+    prefix = namespace + '_'
+    for name, value in PROMETHEUS_LINE_RE.findall(text):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            samples[name] = samples.get(name, 0.0) + float(value)
+    return samples
+
+
+def metrics_row(now, samples, previous=None):
+    '''a row of METRICS_COLUMNS, block_interval is the mean of the blocks since the previous scrape'''
+    interval = ''
+    if previous is not None:
+        count = samples.get('consensus_block_interval_seconds_count', 0) - \
+            previous.get('consensus_block_interval_seconds_count', 0)
+        if count > 0:
+            interval = '%.3f' % ((samples['consensus_block_interval_seconds_sum'] -
+                                  previous.get('consensus_block_interval_seconds_sum', 0)) / count)
+
+    def value(name):
+        return '%d' % samples[name] if name in samples else ''
+
+    return [
+        '%d' % now, value('consensus_height'), value('mempool_size'),
+        interval, value('p2p_peers'), value('consensus_rounds'),
+    ]
+
+
+async def scrape_metrics(cfg, out_path, interval=5, duration=None):
+    '''scrape the prometheus endpoint of all nodes every `interval` seconds, append a csv row per node'''
+    loop = asyncio.get_event_loop()
+    os.makedirs(out_path, exist_ok=True)
+    files = {}
+    for node in cfg['nodes']:
+        path = out_path / Path('%s.csv' % node['name'])
+        new = not path.exists()
+        files[node['name']] = open(path, 'a')
+        if new:
+            files[node['name']].write(','.join(METRICS_COLUMNS) + '\n')
+    previous = {}
+
+    async def scrape(node):
+        try:
+            text = await asyncio.wait_for(http_get(node['base_port'] + 9, '/metrics'), interval)
+        except (OSError, IndexError, asyncio.TimeoutError) as exc:
+            print('%s: %r' % (node['name'], exc), file=sys.stderr)
+            return
+        samples = parse_prometheus(text.decode())
+        fp = files[node['name']]
+        fp.write(','.join(metrics_row(time.time(), samples, previous.get(node['name']))) + '\n')
+        fp.flush()
+        previous[node['name']] = samples
+
+    start = loop.time()
+    try:
+        while duration is None or loop.time() - start < duration:
+            tick = loop.time()
+            await asyncio.gather(*(scrape(node) for node in cfg['nodes']))
+            await asyncio.sleep(max(interval - (loop.time() - tick), 0))
+    finally:
+        for fp in files.values():
+            fp.close()
+
+
+CONSENSUS_LOG_RE = re.compile(
+    rb'^[DIEW]\[(\d{4}-\d\d-\d\d\|\d\d:\d\d:\d\d\.\d+)\] '
+    rb'(?:enter(Propose|Prevote|Precommit|Commit)\((\d+)/(\d+)\)\. Current'
+    rb'|(Executed block|Committed state)\b[^\n]*? height=(\d+))',
+    re.M
+)
+CONSENSUS_STEPS = {
+    b'Propose': 'propose',
+    b'Prevote': 'prevote',
+    b'Precommit': 'precommit',
+    b'Commit': 'commit',
+    b'Executed block': 'executed',
+    b'Committed state': 'committed',
+}
+# (phase, from step, to step)
+CONSENSUS_PHASES = [
+    ('propose', 'propose', 'prevote'),
+    ('prevote', 'prevote', 'precommit'),
+    ('precommit', 'precommit', 'commit'),
+    ('execute', 'commit', 'executed'),
+    ('app_commit', 'executed', 'committed'),
+    ('total', 'propose', 'committed'),
+]
+
+
+def log_time(stamp):
+    '''seconds since epoch of a tendermint log timestamp, e.g. 2019-11-26|08:45:12.123'''
+    return datetime.datetime.strptime(stamp, '%Y-%m-%d|%H:%M:%S.%f').replace(
+        tzinfo=datetime.timezone.utc).timestamp()
+
+
+def scan_consensus_log(path, offset=0, heights=None, chunk_size=1 << 23):
+    '''parse the consensus steps of a tendermint log from offset, in chunks,
+    returns the offset after the last complete line.
+
+    :param heights: {height: {step: time, 'rounds': n}} updated in place, the first
+                    occurrence of each step is kept.
+    '''
+    heights = {} if heights is None else heights
+    with open(path, 'rb') as fp:
+        fp.seek(offset)
+        tail = b''
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            data = tail + chunk
+            end = data.rfind(b'\n') + 1
+            tail = data[end:]
+            for m in CONSENSUS_LOG_RE.finditer(data, 0, end):
+                stamp, step, height, step_round, event, event_height = m.groups()
+                record = heights.setdefault(int(height or event_height), {})
+                name = CONSENSUS_STEPS[step or event]
+                if name not in record:
+                    record[name] = log_time(stamp.decode())
+                if step_round is not None:
+                    record['rounds'] = max(record.get('rounds', 1), int(step_round) + 1)
+            offset += end
+    return offset
+
+
+def block_breakdown(height, records):
+    '''latency breakdown of a block across nodes, in milliseconds
+    :param records: {node name: {step: time}}
+    '''
+    nodes = {}
+    for name, record in records.items():
+        phases = {
+            phase: round((record[end] - record[start]) * 1000, 3)
+            for phase, start, end in CONSENSUS_PHASES
+            if start in record and end in record
+        }
+        phases['rounds'] = record.get('rounds', 1)
+        nodes[name] = phases
+    slowest = {}
+    for phase, _, _ in CONSENSUS_PHASES:
+        values = [(phases[phase], name) for name, phases in nodes.items() if phase in phases]
+        if values:
+            value, name = max(values)
+            slowest[phase] = {'node': name, 'ms': value}
+    committed = [r['committed'] for r in records.values() if 'committed' in r]
+    return {
+        'height': height,
+        'time': datetime.datetime.fromtimestamp(
+            min(committed), datetime.timezone.utc).replace(tzinfo=None).isoformat()
+                if committed else None,
+        'commit_spread_ms': round((max(committed) - min(committed)) * 1000, 3) if committed else None,
+        'slowest': slowest,
+        'nodes': nodes,
+    }
+
+
+class Logs:
+    def analyze(self, spec=None, reset=False, output=None):
+        '''Per block consensus latency breakdown from logs/tendermint-<node>.log, as json lines.
+
+        The logs are parsed from the offsets saved in <root_path>/.cache/logs.json by the
+        previous run, so only new blocks are reported. A block is reported once every node
+        has committed it, or has committed a later block.
+        :param spec: Path of specification file, [default: stdin]
+        :param reset: Parse the logs from the beginning
+        :param output: Append to this file, [default: stdout]
+        '''
+        cfg = json.load(open(spec) if spec else sys.stdin)
+        root_path = Path(cfg['root_path']).resolve()
+        state_path = root_path / Path('.cache') / Path('logs.json')
+        state = {}
+        if not reset:
+            try:
+                with open(state_path) as fp:
+                    state = json.load(fp)
+            except (FileNotFoundError, ValueError):
+                pass
+
+        pending = {}  # height -> {node: record}
+        latest = {}  # node -> highest committed height
+        for node in cfg['nodes']:
+            name = node['name']
+            path = root_path / Path('logs') / Path(f'tendermint-{name}.log')
+            saved = state.get(name, {})
+            heights = {int(h): r for h, r in saved.get('pending', {}).items()}
+            offset = saved.get('offset', 0)
+            if not path.exists():
+                continue
+            if path.stat().st_size < offset:
+                # truncated or rotated
+                offset = 0
+            offset = scan_consensus_log(path, offset, heights)
+            state[name] = {'offset': offset, 'latest': saved.get('latest', 0)}
+            for height, record in heights.items():
+                pending.setdefault(height, {})[name] = record
+                if 'committed' in record:
+                    state[name]['latest'] = max(state[name]['latest'], height)
+            latest[name] = state[name]['latest']
+
+        out = open(output, 'a') if output else sys.stdout
+        try:
+            for height in sorted(pending):
+                records = pending[height]
+                if all(name in records and 'committed' in records[name] or latest[name] > height
+                       for name in latest):
+                    out.write(json.dumps(block_breakdown(height, records)) + '\n')
+                    del pending[height]
+        finally:
+            if output:
+                out.close()
+
+        for height, records in pending.items():
+            for name, record in records.items():
+                state[name].setdefault('pending', {})[str(height)] = record
+        os.makedirs(state_path.parent, exist_ok=True)
+        with open(state_path, 'w') as fp:
+            json.dump(state, fp)
 
 
 class CLI:
+    def __init__(self):
+        self.logs = Logs()
+
     def gen(self, count=1, rewards_pool=0,
             genesis_time="2019-11-20T08:56:48.618137Z",
             base_fee='0.0', per_byte_fee='0.0',
             base_port=26650, sgx_device=None,
-            chain_id='test-chain-y3m1e6-AB', root_path='./data'):
+            chain_id='test-chain-y3m1e6-AB', root_path='./data',
+            topology='mesh', peer_degree=4,
+            accounts=0, accounts_file=None, account_amount=100000000):
         '''Generate testnet node specification
         :param count: Number of nodes, [default: 1].
+        :param topology: Peer topology, [mesh|ring|regular|hub] [default: mesh].
+        :param peer_degree: Peers per node for regular topology, and the peer limit of hub topology, [default: 4].
+        :param accounts: Number of generated pre-funded accounts, [default: 0].
+        :param accounts_file: File of pre-funded staking addresses, one per line.
+        :param account_amount: Coins of each pre-funded account, [default: 100000000].
         '''
         max_coin = 10000000000000000000
-        share = int(int(max_coin - rewards_pool) / count / 2)
+        if accounts_file:
+            accounts_spec = {'file': accounts_file, 'amount': account_amount}
+        elif accounts:
+            accounts_spec = {'count': accounts, 'amount': account_amount,
+                             'seed': random.randrange(2 ** 32)}
+        else:
+            accounts_spec = None
+        funded = count_accounts(accounts_spec) * account_amount
+        share = int((max_coin - rewards_pool - funded) // count // 2)
+        if share <= 0:
+            raise ValueError('pre-funded accounts (%d) and rewards pool (%d) leave no coins '
+                             'for the nodes, max is %d' % (funded, rewards_pool, max_coin))
         sgx_mode = '' if sgx_device else '-sw'
         cfg = {
             'root_path': './data',
@@ -501,6 +1177,13 @@ class CLI:
                 {'op': 'replace', 'path': '/initial_fee_policy/base_fee', 'value': '0.0'},
                 {'op': 'replace', 'path': '/initial_fee_policy/per_byte_fee', 'value': '0.0'},
             ],
+            'p2p_topology': {
+                'mode': topology,
+                'degree': peer_degree,
+                'seed': random.randrange(2 ** 32),
+            },
+            'accounts': accounts_spec,
+            'prometheus': True,
             'tendermint_config_patch': [
                 {'op': 'replace', 'path': '/consensus/create_empty_blocks', 'value': True},
                 {'op': 'add', 'path': '/consensus/create_empty_blocks_interval', 'value': '0s'},
@@ -508,13 +1191,70 @@ class CLI:
         }
         print(json.dumps(cfg, indent=4))
 
-    def prepare(self, spec=None):
+    def up(self, spec=None, timeout=60, keep_running=True):
+        '''Start a prepared cluster without supervisord, report the cold start timings
+        :param spec: Path of specification file, [default: stdin]
+        :param timeout: Seconds to wait for each process to be ready, and for the first block, [default: 60]
+        :param keep_running: Keep the cluster running after the first block, [default: True]
+        '''
+        cfg = json.load(open(spec) if spec else sys.stdin)
+        try:
+            asyncio.run(up_cluster(cfg, timeout, keep_running))
+        except KeyboardInterrupt:
+            pass
+
+    def bench_keys(self, sizes=(10, 100, 1000)):
+        '''Compare key derivation of the prepare pipeline with and without the key registry
+        :param sizes: Numbers of nodes to benchmark, [default: 10,100,1000]
+        '''
+        def derive(factory, seeds):
+            for validator_seed, node_seed in seeds:
+                # gen_genesis, app_state_cfg, gen_peers, node_key * 2
+                factory(validator_seed).validator_address()
+                factory(validator_seed).pub_key_base64()
+                factory(validator_seed).pub_key_base64()
+                factory(node_seed).validator_address()
+                factory(node_seed).priv_key_base64()
+                factory(validator_seed).priv_key_base64()
+
+        for size in (sizes if isinstance(sizes, (list, tuple)) else [sizes]):
+            seeds = [(gen_seed(), gen_seed()) for _ in range(size)]
+            t = time.perf_counter()
+            derive(SigningKey, seeds)
+            uncached = time.perf_counter() - t
+            signing_key.cache_clear()
+            t = time.perf_counter()
+            derive(signing_key, seeds)
+            cached = time.perf_counter() - t
+            signing_key.cache_clear()
+            print('nodes=%-6d uncached=%.4fs registry=%.4fs speedup=%.1fx' % (
+                size, uncached, cached, uncached / cached))
+
+    def metrics(self, spec=None, interval=5, duration=None, output=None):
+        '''Scrape the prometheus metrics of all nodes, appended to <output>/<node>.csv
+        :param spec: Path of specification file, [default: stdin]
+        :param interval: Seconds between scrapes, [default: 5]
+        :param duration: Seconds to run, [default: until interrupted]
+        :param output: Directory of the csv files, [default: <root_path>/metrics]
+        '''
+        cfg = json.load(open(spec) if spec else sys.stdin)
+        out_path = Path(output) if output else Path(cfg['root_path']) / Path('metrics')
+        try:
+            asyncio.run(scrape_metrics(cfg, out_path, interval, duration))
+        except KeyboardInterrupt:
+            pass
+
+    def prepare(self, spec=None, concurrency=8, refresh_cache=False, incremental=False):
         '''Prepare tendermint testnet based on specification
         :param spec: Path of specification file, [default: stdin]
+        :param concurrency: Number of wallets derived in parallel, [default: 8]
+        :param refresh_cache: Ignore cached results under <root_path>/.cache and regenerate them
+        :param incremental: Only rewrite files changed since the last prepare
         '''
         cfg = json.load(open(spec) if spec else sys.stdin)
-        asyncio.run(init_cluster(cfg))
+        touched = asyncio.run(init_cluster(cfg, concurrency, refresh_cache, incremental))
         print('Prepared succesfully', cfg['root_path'])
+        print('Updated nodes:', ', '.join(touched) or 'none')
 
 
 if __name__ == '__main__':
@@ -1,13 +1,44 @@
 #!/usr/bin/env python3
+import io
+import os
+import re
+import shlex
+import atexit
+import subprocess
+import sys
 import getpass
+import json
+import asyncio
+import collections
+import queue
+import sqlite3
+import threading
+import time
+import ast
+import base64
+import hashlib
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 
 import fire
-from jsonrpcclient import request
+from requests.adapters import HTTPAdapter
+from jsonrpcclient.clients.http_client import HTTPClient
+from jsonrpcclient.exceptions import ReceivedErrorResponseError, ReceivedNon2xxResponseError
+from jsonrpcclient.parse import parse
+from jsonrpcclient.requests import Request
 from decouple import config
 
 CLIENT_RPC_URL = config('CLIENT_RPC_URL', 'http://127.0.0.1:26651')
 CHAIN_RPC_URL = config('CHAIN_RPC_URL', 'http://127.0.0.1:26657')
 DEFAULT_WALLET = config('DEFAULT_WALLET', 'Default')
+WALLET_SESSION_TIMEOUT = config('WALLET_SESSION_TIMEOUT', 300, cast=float)
+RPC_TIMEOUT = config('RPC_TIMEOUT', 30, cast=float)
+RPC_POOL_SIZE = config('RPC_POOL_SIZE', 10, cast=int)
+RPC_BATCH_SIZE = config('RPC_BATCH_SIZE', 100, cast=int)
+RPC_CONCURRENCY = config('RPC_CONCURRENCY', 100, cast=int)
+STATUS_TTL = config('STATUS_TTL', 1.0, cast=float)
+BLOCK_STORE = config('BLOCK_STORE', '')
+BLOCK_STORE_MAX_BYTES = config('BLOCK_STORE_MAX_BYTES', 1024 ** 3, cast=int)
 
 
 def get_passphrase():
@@ -17,14 +48,331 @@ def get_passphrase():
     return phrase
 
 
+class WalletSessions:
+    '''Wallet credentials kept in memory, so the passphrase is asked once per wallet.
+
+    A session is dropped after `timeout` seconds without being used.
+    '''
+    def __init__(self, timeout=WALLET_SESSION_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sessions = {}  # name -> [credentials, last used]
+
+    def open(self, name, passphrase=None):
+        with self._lock:
+            credentials = [name, passphrase if passphrase is not None else get_passphrase()]
+            self._sessions[name] = [credentials, time.monotonic()]
+            return credentials
+
+    def credentials(self, name):
+        '''[name, passphrase] of the wallet, asking the passphrase if there's no live session'''
+        with self._lock:
+            now = time.monotonic()
+            session = self._sessions.get(name)
+            if session is None or now - session[1] > self.timeout:
+                session = self._sessions[name] = [[name, get_passphrase()], now]
+            session[1] = now
+            return session[0]
+
+    def close(self, name=None):
+        with self._lock:
+            if name is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(name, None)
+
+
+sessions = WalletSessions()
+
+
+class RPCError(Exception):
+    '''Error response of a single call in a batch'''
+    def __init__(self, code, message, data=None):
+        super().__init__(code, message, data)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    def __str__(self):
+        return '%s (%s)' % (self.message, self.data) if self.data else str(self.message)
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# callables invoked after every request with
+# (url, method, elapsed seconds, bytes sent, bytes received, exception or None)
+HOOKS = []
+
+
+def observe(url, method, elapsed, sent, received, error):
+    for hook in HOOKS:
+        hook(url, method, elapsed, sent, received, error)
+
+
+class Metrics:
+    '''Request counts, errors, bytes and latency histograms per endpoint and method'''
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def __call__(self, url, method, elapsed, sent, received, error):
+        with self._lock:
+            series = self._series.get((url, method))
+            if series is None:
+                series = self._series[(url, method)] = {
+                    'count': 0, 'errors': 0, 'sent_bytes': 0, 'received_bytes': 0,
+                    'latency_sum': 0.0, 'buckets': [0] * len(self.BUCKETS),
+                }
+            series['count'] += 1
+            series['errors'] += error is not None
+            series['sent_bytes'] += sent
+            series['received_bytes'] += received
+            series['latency_sum'] += elapsed
+            for i, le in enumerate(self.BUCKETS):
+                if elapsed <= le:
+                    series['buckets'][i] += 1
+                    break
+
+    def summary(self):
+        '''json friendly summary, with latency percentiles estimated from the buckets'''
+        with self._lock:
+            result = []
+            for (url, method), series in sorted(self._series.items()):
+                item = dict(series, endpoint=url, method=method)
+                del item['buckets']
+                item['latency_avg'] = series['latency_sum'] / series['count']
+                for p in (50, 90, 99):
+                    item['latency_p%d' % p] = self._quantile(series, p / 100)
+                result.append(item)
+            return result
+
+    def _quantile(self, series, q):
+        '''upper bound of the bucket the quantile falls in'''
+        rank = q * series['count']
+        seen = 0
+        for le, n in zip(self.BUCKETS, series['buckets']):
+            seen += n
+            if seen >= rank:
+                return le if le != float('inf') else None
+
+    def prometheus(self):
+        '''prometheus text exposition format'''
+        lines = []
+        with self._lock:
+            items = sorted(self._series.items())
+            for name, key, kind in (
+                    ('chainrpc_requests_total', 'count', 'counter'),
+                    ('chainrpc_errors_total', 'errors', 'counter'),
+                    ('chainrpc_sent_bytes_total', 'sent_bytes', 'counter'),
+                    ('chainrpc_received_bytes_total', 'received_bytes', 'counter')):
+                lines.append('# TYPE %s %s' % (name, kind))
+                for (url, method), series in items:
+                    lines.append('%s{endpoint="%s",method="%s"} %s' % (name, url, method, series[key]))
+            name = 'chainrpc_request_duration_seconds'
+            lines.append('# TYPE %s histogram' % name)
+            for (url, method), series in items:
+                labels = 'endpoint="%s",method="%s"' % (url, method)
+                total = 0
+                for le, n in zip(self.BUCKETS, series['buckets']):
+                    total += n
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (
+                        name, labels, '+Inf' if le == float('inf') else le, total))
+                lines.append('%s_sum{%s} %f' % (name, labels, series['latency_sum']))
+                lines.append('%s_count{%s} %d' % (name, labels, series['count']))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port):
+        '''serve the prometheus endpoint from a background thread'''
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                data = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('', port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Transport:
+    '''JSON-RPC over a pooled keep-alive http session'''
+    def __init__(self, url, timeout=RPC_TIMEOUT, pool_size=RPC_POOL_SIZE):
+        self.url = url
+        self.timeout = timeout
+        self._client = HTTPClient(url)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._client.session.mount('http://', adapter)
+        self._client.session.mount('https://', adapter)
+
+    def _send(self, label, body, batch=False):
+        t0 = time.perf_counter()
+        received = 0
+        error = None
+        try:
+            rsp = self._client.send(body, validate_against_schema=not batch,
+                                    timeout=self.timeout)
+            received = len(rsp.text)
+            return rsp
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            observe(self.url, label, time.perf_counter() - t0, len(body), received, error)
+
+    def call(self, method, *args):
+        return self._send(method, str(Request(method, *args))).data.result
+
+    def batch(self, calls, batch_size=RPC_BATCH_SIZE):
+        '''Send calls as JSON-RPC batches of at most batch_size calls
+        :param calls: Iterable of (method, args) pairs.
+        :returns: Results in the order of calls, RPCError in place of failed calls.'''
+        results = []
+        for chunk in chunks(calls, batch_size):
+            requests = [Request(method, *args) for method, args in chunk]
+            rsp = self._send(batch_label(requests), json.dumps(requests), batch=True)
+            results.extend(batch_results(requests, rsp.data))
+        return results
+
+
+def batch_label(requests):
+    methods = {req['method'] for req in requests}
+    return 'batch:%s' % methods.pop() if len(methods) == 1 else 'batch'
+
+
+def batch_results(requests, responses):
+    '''match batch responses to requests by id'''
+    responses = {r.id: r for r in responses}
+    for req in requests:
+        r = responses.get(req['id'])
+        if r is None:
+            yield RPCError(None, 'missing response')
+        elif r.ok:
+            yield r.result
+        else:
+            yield RPCError(r.code, r.message, r.data)
+
+
+def websocket_url(url):
+    return re.sub(r'^http', 'ws', url.rstrip('/')) + '/websocket'
+
+
+class AsyncTransport:
+    '''JSON-RPC over an aiohttp session, at most `concurrency` requests in flight'''
+    def __init__(self, url, timeout=RPC_TIMEOUT, concurrency=RPC_CONCURRENCY):
+        self.url = url
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._session = None
+        self._limiter = None
+
+    def _open(self):
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=HTTPClient.DEFAULT_HEADERS,
+            )
+            self._limiter = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def _send(self, label, body, batch=False):
+        self._open()
+        async with self._limiter:
+            # time spent waiting for the limiter is not counted as latency
+            t0 = time.perf_counter()
+            received = 0
+            error = None
+            try:
+                async with self._session.post(self.url, data=body) as rsp:
+                    if not 200 <= rsp.status <= 299:
+                        raise ReceivedNon2xxResponseError(rsp.status)
+                    text = await rsp.text()
+                received = len(text)
+                data = parse(text, batch=batch, validate_against_schema=False)
+                if not batch and not data.ok:
+                    raise ReceivedErrorResponseError(data)
+                return data
+            except Exception as exc:
+                error = exc
+                raise
+            finally:
+                observe(self.url, label, time.perf_counter() - t0, len(body), received, error)
+
+    async def call(self, method, *args):
+        return (await self._send(method, str(Request(method, *args)))).result
+
+    async def batch(self, calls, batch_size=RPC_BATCH_SIZE):
+        '''Same as Transport.batch, the batches are sent concurrently'''
+        async def send(requests):
+            data = await self._send(batch_label(requests), json.dumps(requests), batch=True)
+            return list(batch_results(requests, data))
+
+        batches = [
+            [Request(method, *args) for method, args in chunk]
+            for chunk in chunks(calls, batch_size)
+        ]
+        results = []
+        for chunk in await asyncio.gather(*(send(requests) for requests in batches)):
+            results.extend(chunk)
+        return results
+
+    async def websocket(self):
+        '''connect to the websocket endpoint of the node'''
+        return await self._open().ws_connect(websocket_url(self.url), heartbeat=30)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+client_transport = Transport(CLIENT_RPC_URL)
+chain_transport = Transport(CHAIN_RPC_URL)
+
+
 def call(method, *args):
-    rsp = request(CLIENT_RPC_URL, method, *args)
-    return rsp.data.result
+    return client_transport.call(method, *args)
 
 
 def call_chain(method, *args):
-    rsp = request(CHAIN_RPC_URL, method, *args)
-    return rsp.data.result
+    return chain_transport.call(method, *args)
+
+
+def batch(calls, batch_size=RPC_BATCH_SIZE):
+    return client_transport.batch(calls, batch_size)
+
+
+def batch_chain(calls, batch_size=RPC_BATCH_SIZE):
+    return chain_transport.batch(calls, batch_size)
+
+
+def chain_height():
+    '''latest block height of the chain rpc, None if it's not reachable'''
+    try:
+        return int(call_chain('status')['sync_info']['latest_block_height'])
+    except Exception:
+        return None
 
 
 def fix_address(addr):
@@ -36,204 +384,1600 @@ def fix_address(addr):
 
 
 class Address:
+    def __init__(self, transport=None):
+        self._rpc = transport or client_transport
+
     def list(self, name=DEFAULT_WALLET, type='staking'):
         '''list addresses
         :param name: Name of the wallet. [default: Default]
         :params type: [staking|transfer]'''
-        return call('wallet_listStakingAddresses' if type == 'staking' else 'wallet_listTransferAddresses', [name, get_passphrase()])
+        return self._rpc.call('wallet_listStakingAddresses' if type == 'staking' else 'wallet_listTransferAddresses', sessions.credentials(name))
 
     def create(self, name=DEFAULT_WALLET, type='staking'):
         '''Create address
         :param name: Name of the wallet
         :param type: Type of address. [staking|transfer]'''
-        return call(
+        return self._rpc.call(
             'wallet_createStakingAddress'
             if type == 'staking'
             else 'wallet_createTransferAddress',
-            [name, get_passphrase()])
+            sessions.credentials(name))
 
 
 class Wallet:
+    def __init__(self, transport=None):
+        self._rpc = transport or client_transport
+
     def balance(self, name=DEFAULT_WALLET):
         '''Get balance of wallet
         :param name: Name of the wallet. [default: Default]'''
-        return call('wallet_balance', [name, get_passphrase()])
+        return self._rpc.call('wallet_balance', sessions.credentials(name))
 
     def list(self):
-        return call('wallet_list')
+        return self._rpc.call('wallet_list')
 
     def create(self, name=DEFAULT_WALLET, type='Basic'):
         '''create wallet
         :param name: Name of the wallet. [defualt: Default]
         :param type: Type of the wallet. [Basic|HD] [default: Basic]
         '''
-        return call('wallet_create', [name, get_passphrase()], type)
+        return self._rpc.call('wallet_create', sessions.credentials(name), type)
 
     def restore(self, mnemonics, name=DEFAULT_WALLET):
         '''restore wallet
         :param name: Name of the wallet. [defualt: Default]
         :param mnemonics: mnemonics words
         '''
-        return call('wallet_restore', [name, get_passphrase()], mnemonics)
+        return self._rpc.call('wallet_restore', sessions.credentials(name), mnemonics)
 
     def view_key(self, name=DEFAULT_WALLET):
-        return call(
-            'wallet_getViewKey'
-            [name, get_passphrase()]
+        return self._rpc.call(
+            'wallet_getViewKey',
+            sessions.credentials(name)
         )
 
     def list_pubkey(self, name=DEFAULT_WALLET):
-        return call('wallet_listPublicKeys', [name, get_passphrase()])
+        return self._rpc.call('wallet_listPublicKeys', sessions.credentials(name))
 
     def transactions(self, name=DEFAULT_WALLET):
-        return call('wallet_transactions', [name, get_passphrase()])
+        return self._rpc.call('wallet_transactions', sessions.credentials(name))
 
     def send(self, to_address, amount, name=DEFAULT_WALLET, view_keys=None):
-        return call(
+        return self._rpc.call(
             'wallet_sendToAddress',
-            [name, get_passphrase()],
+            sessions.credentials(name),
             to_address, str(amount), view_keys or [])
 
     def sync(self, name=DEFAULT_WALLET):
-        return call('sync', [name, get_passphrase()])
+        return self._rpc.call('sync', sessions.credentials(name))
 
     def sync_all(self, name=DEFAULT_WALLET):
-        return call('sync_all', [name, get_passphrase()])
+        return self._rpc.call('sync_all', sessions.credentials(name))
 
     def sync_unlock(self, name=DEFAULT_WALLET):
-        return call('sync_unlockWallet', [name, get_passphrase()])
+        return self._rpc.call('sync_unlockWallet', sessions.credentials(name))
 
     def sync_stop(self, name=DEFAULT_WALLET):
-        return call('sync_stop', [name, get_passphrase()])
+        return self._rpc.call('sync_stop', sessions.credentials(name))
+
+    def sync_many(self, names=None, concurrency=4, unlock=False, timeout=None, interval=5):
+        '''Sync many wallets concurrently, progress is printed to stderr as json lines.
+
+        client-rpc doesn't report sync progress, the reported rates are estimates:
+        full_scan_blocks_per_sec is the chain height over the sync time, as if the
+        wallet scanned the whole chain, and eta_estimate of a running wallet is the
+        average sync time of the finished ones minus its elapsed time.
+        :param names: Names of the wallets, [default: all of wallet_list]
+        :param concurrency: Wallets synced at the same time, [default: 4]
+        :param unlock: Call sync_unlockWallet before syncing, [default: False]
+        :param timeout: Seconds after which unfinished syncs are stopped with sync_stop, [default: no limit]
+        :param interval: Seconds between progress reports, [default: 5]
+        '''
+        if names is None:
+            names = self.list()
+        elif isinstance(names, str):
+            names = [names]
+        # ask the passphrases up front, not from the worker threads
+        credentials = {name: sessions.credentials(name) for name in names}
+        # sync blocks for the whole scan, don't apply RPC_TIMEOUT, but give up on
+        # syncs that don't return after sync_stop
+        rpc = Transport(self._rpc.url, timeout=timeout and timeout + RPC_TIMEOUT,
+                        pool_size=concurrency)
+        height = chain_height()
+        start = time.monotonic()
+        report = {name: {'name': name, 'status': 'pending'} for name in names}
+
+        def sync(name):
+            if unlock:
+                rpc.call('sync_unlockWallet', credentials[name])
+            report[name]['status'] = 'syncing'
+            report[name]['started'] = time.monotonic()
+            try:
+                rpc.call('sync', credentials[name])
+            finally:
+                report[name]['finished'] = time.monotonic()
+
+        def progress():
+            now = time.monotonic()
+            done = [r['elapsed'] for r in report.values() if r['status'] == 'done']
+            average = sum(done) / len(done) if done else None
+            for r in report.values():
+                if r['status'] == 'syncing':
+                    r['elapsed'] = round(now - r['started'], 3)
+                    # no estimate before a wallet finished, or once it runs longer than the average
+                    if average is not None and average > r['elapsed']:
+                        r['eta_estimate'] = round(average - r['elapsed'], 3)
+                    else:
+                        r.pop('eta_estimate', None)
+            print(json.dumps({
+                'elapsed': round(now - start, 3),
+                'height': height,
+                'wallets': [
+                    {k: v for k, v in r.items() if k not in ('started', 'finished')}
+                    for r in report.values() if r['status'] != 'pending'
+                ],
+            }), file=sys.stderr, flush=True)
+
+        def finish(name, future, stopped=False):
+            r = report[name]
+            r['elapsed'] = round(r.pop('finished', time.monotonic()) - r.get('started', start), 3)
+            r.pop('eta_estimate', None)
+            exc = future.exception()
+            if stopped:
+                # sync may return an error once it's stopped, keep it as detail
+                r['status'] = 'timeout' if 'stop_error' in r else 'stopped'
+            else:
+                r['status'] = 'error' if exc is not None else 'done'
+            if exc is not None:
+                r['error'] = str(exc)
+            elif height and not stopped and r['elapsed'] > 0:
+                r['full_scan_blocks_per_sec'] = round(height / r['elapsed'], 1)
+
+        deadline = start + timeout if timeout is not None else None
+        reported = start
+        with ThreadPoolExecutor(concurrency) as executor:
+            futures = {executor.submit(sync, name): name for name in names}
+            pending = set(futures)
+            while pending:
+                wait = max(reported + interval - time.monotonic(), 0)
+                if deadline is not None:
+                    wait = max(min(wait, deadline - time.monotonic()), 0)
+                finished, pending = concurrent.futures.wait(
+                    pending, wait, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    finish(futures[future], future)
+                if deadline is not None and time.monotonic() >= deadline and pending:
+                    for future in pending:
+                        if future.cancel():
+                            report[futures[future]]['status'] = 'cancelled'
+                        else:
+                            name = futures[future]
+                            try:
+                                self._rpc.call('sync_stop', credentials[name])
+                            except Exception as exc:
+                                # the sync still ends with the transport timeout
+                                report[name]['stop_error'] = str(exc)
+                    for future in concurrent.futures.as_completed(pending):
+                        if not future.cancelled():
+                            finish(futures[future], future, stopped=True)
+                    pending = set()
+                elif pending and time.monotonic() >= reported + interval:
+                    progress()
+                    reported = time.monotonic()
+        return [
+            {k: v for k, v in r.items() if k != 'started'}
+            for r in report.values()
+        ]
+
+    def unlock(self, name=DEFAULT_WALLET, passphrase=None):
+        '''Unlock the wallet with sync_unlockWallet and keep its credentials for the
+        following calls, until WALLET_SESSION_TIMEOUT idle seconds (useful with `serve`)
+        :param passphrase: [default: PASSPHRASE or prompt]'''
+        return self._rpc.call('sync_unlockWallet', sessions.open(name, passphrase))
+
+    def lock(self, name=DEFAULT_WALLET):
+        '''Forget the credentials of the wallet'''
+        sessions.close(name)
 
 
 class Staking:
+    def __init__(self, transport=None):
+        self._rpc = transport or client_transport
+
     def deposit_stake(self, to_address, inputs, name=DEFAULT_WALLET):
-        return call('staking_depositStake', [name, get_passphrase()], fix_address(to_address), inputs)
+        return self._rpc.call('staking_depositStake', sessions.credentials(name), fix_address(to_address), inputs)
 
     def state(self, address, name=DEFAULT_WALLET):
-        return call('staking_state', [name, get_passphrase()], fix_address(address))
+        return self._rpc.call('staking_state', sessions.credentials(name), fix_address(address))
+
+    def states(self, addresses, name=DEFAULT_WALLET, batch_size=RPC_BATCH_SIZE):
+        '''staking state of many addresses in batched requests
+        :param addresses: List of staking addresses'''
+        credentials = sessions.credentials(name)
+        return self._rpc.batch(
+            (('staking_state', (credentials, fix_address(address))) for address in addresses),
+            batch_size
+        )
 
     def unbond_stake(self, address, amount, name=DEFAULT_WALLET):
-        return call('staking_unbondStake', [name, get_passphrase()], fix_address(address), amount)
+        return self._rpc.call('staking_unbondStake', sessions.credentials(name), fix_address(address), amount)
 
     def withdraw_all_unbonded_stake(self, from_address, to_address, name=DEFAULT_WALLET):
-        return call(
+        return self._rpc.call(
             'staking_withdrawAllUnbondedStake',
-            [name, get_passphrase()],
+            sessions.credentials(name),
             fix_address(from_address), to_address, []
         )
 
     def unjail(self, address, name=DEFAULT_WALLET):
-        return call('staking_unjail', [name, get_passphrase()], fix_address(address))
+        return self._rpc.call('staking_unjail', sessions.credentials(name), fix_address(address))
 
 
 class MultiSig:
+    def __init__(self, transport=None):
+        self._rpc = transport or client_transport
+
     def create_address(self, public_keys, self_public_key, required_signatures, name=DEFAULT_WALLET):
-        return call('multiSig_createAddress',
-                   [name, get_passphrase()],
+        return self._rpc.call('multiSig_createAddress',
+                   sessions.credentials(name),
                    public_keys,
                    self_public_key,
                    required_signatures)
 
     def new_session(self, message, signer_public_keys, self_public_key, name=DEFAULT_WALLET):
-        return call('multiSig_newSession',
-                   [name, get_passphrase()],
+        return self._rpc.call('multiSig_newSession',
+                   sessions.credentials(name),
                    message,
                    signer_public_keys,
                    self_public_key)
 
     def nonce_commitment(self, session_id, passphrase):
-        return call('multiSig_nonceCommitment', session_id, passphrase)
+        return self._rpc.call('multiSig_nonceCommitment', session_id, passphrase)
 
     def add_nonce_commitment(self, session_id, passphrase, nonce_commitment, public_key):
-        return call('multiSig_addNonceCommitment', session_id, passphrase, nonce_commitment, public_key)
+        return self._rpc.call('multiSig_addNonceCommitment', session_id, passphrase, nonce_commitment, public_key)
 
     def nonce(self, session_id, passphrase):
-        return call('multiSig_nonce', session_id, passphrase)
+        return self._rpc.call('multiSig_nonce', session_id, passphrase)
 
     def add_nonce(self, session_id, passphrase, nonce, public_key):
-        return call('multiSig_addNonce', session_id, passphrase, nonce, public_key)
+        return self._rpc.call('multiSig_addNonce', session_id, passphrase, nonce, public_key)
 
     def partial_signature(self, session_id, passphrase):
-        return call('multiSig_partialSign', session_id, passphrase)
+        return self._rpc.call('multiSig_partialSign', session_id, passphrase)
 
     def add_partial_signature(self, session_id, passphrase, partial_signature, public_key):
-        return call('multiSig_addPartialSignature', session_id, passphrase, partial_signature, public_key)
+        return self._rpc.call('multiSig_addPartialSignature', session_id, passphrase, partial_signature, public_key)
 
     def signature(self, session_id, passphrase):
-        return call('multiSig_signature', session_id, passphrase)
+        return self._rpc.call('multiSig_signature', session_id, passphrase)
 
     def broadcast_with_signature(self, session_id, unsigned_transaction, name=DEFAULT_WALLET):
-        return call('multiSig_broadcastWithSignature',
-                   [name, get_passphrase()],
+        return self._rpc.call('multiSig_broadcastWithSignature',
+                   sessions.credentials(name),
                    session_id,
                    unsigned_transaction)
 
 
+class BlockStore:
+    '''Local sqlite store of immutable chain data, indexed by height, block hash and txid.
+
+    Least recently read entries are evicted when the stored json, plus the hash and
+    txid index rows of the stored blocks, exceeds max_bytes.
+    '''
+    def __init__(self, path, max_bytes=BLOCK_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript('''
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT, key TEXT, data TEXT, size INTEGER, atime REAL,
+                PRIMARY KEY (kind, key)
+            );
+            CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime);
+            CREATE TABLE IF NOT EXISTS block_hashes (hash TEXT PRIMARY KEY, height INTEGER);
+            CREATE INDEX IF NOT EXISTS block_hashes_height ON block_hashes (height);
+            CREATE TABLE IF NOT EXISTS txs (txid TEXT PRIMARY KEY, height INTEGER);
+            CREATE INDEX IF NOT EXISTS txs_height ON txs (height);
+        ''')
+        self._size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, kind, key):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT data FROM entries WHERE kind = ? AND key = ?', (kind, str(key))
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                'UPDATE entries SET atime = ? WHERE kind = ? AND key = ?',
+                (time.time(), kind, str(key))
+            )
+            return json.loads(row[0])
+
+    def put(self, kind, key, value):
+        data = json.dumps(value)
+        with self._lock:
+            old = self._db.execute(
+                'SELECT size FROM entries WHERE kind = ? AND key = ?', (kind, str(key))
+            ).fetchone()
+            # the index rows of a block are accounted as part of its entry
+            size = len(data) + (self._index_block(value) if kind == 'block' else 0)
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                (kind, str(key), data, size, time.time())
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _index_block(self, block):
+        '''index the hash and txids of a block, returns the approximate size of the rows'''
+        height = int(block['block']['header']['height'])
+        self._drop_index(height)
+        rows = [(block['block_meta']['block_id']['hash'].upper(), height)]
+        self._db.execute('INSERT OR REPLACE INTO block_hashes VALUES (?, ?)', rows[0])
+        txs = [
+            (hashlib.sha256(base64.b64decode(tx)).hexdigest().upper(), height)
+            for tx in block['block']['data']['txs'] or []
+        ]
+        self._db.executemany('INSERT OR REPLACE INTO txs VALUES (?, ?)', txs)
+        return sum(len(key) + 8 for key, _ in rows + txs)
+
+    def _drop_index(self, height):
+        self._db.execute('DELETE FROM block_hashes WHERE height = ?', (height,))
+        self._db.execute('DELETE FROM txs WHERE height = ?', (height,))
+
+    def _evict(self):
+        '''drop least recently read entries until 90% of max_bytes'''
+        target = self.max_bytes * 9 // 10
+        for kind, key, size in self._db.execute(
+                'SELECT kind, key, size FROM entries ORDER BY atime').fetchall():
+            if self._size <= target:
+                break
+            self._db.execute('DELETE FROM entries WHERE kind = ? AND key = ?', (kind, key))
+            if kind == 'block':
+                self._drop_index(int(key))
+            self._size -= size
+
+    def block_height(self, block_hash):
+        '''height of a stored block hash'''
+        with self._lock:
+            row = self._db.execute('SELECT height FROM block_hashes WHERE hash = ?',
+                                   (block_hash.upper(),)).fetchone()
+        return row and row[0]
+
+    def tx_height(self, txid):
+        '''height of the block including a stored tx, txid in hex'''
+        with self._lock:
+            row = self._db.execute('SELECT height FROM txs WHERE txid = ?',
+                                   (txid.upper(),)).fetchone()
+        return row and row[0]
+
+
+def default_store():
+    return BlockStore(BLOCK_STORE) if BLOCK_STORE else None
+
+
+def save_checkpoint(path, out, height):
+    '''record height as done after the output is flushed'''
+    out.flush()
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fp:
+        fp.write(str(height))
+    os.replace(tmp, path)
+
+
 class Blockchain:
-    def status(self):
-        return call_chain('status')
+    def __init__(self, transport=None, store=None, status_ttl=STATUS_TTL):
+        self._rpc = transport or chain_transport
+        self._store = store
+        self.status_ttl = status_ttl
+        self._status = None
+        self._status_expiry = 0
+
+    def _status_fresh(self, fresh):
+        return not fresh and self._status is not None and time.monotonic() < self._status_expiry
+
+    def _set_status(self, status):
+        self._status = status
+        self._status_expiry = time.monotonic() + self.status_ttl
+        return status
+
+    def _observe_height(self, height):
+        '''drop the cached status once a newer block is seen'''
+        if self._status is not None and \
+                int(height) > int(self._status['sync_info']['latest_block_height']):
+            self._status = None
+
+    @staticmethod
+    def _at(height):
+        '''tendermint takes a null height as the latest one'''
+        return None if height == 'latest' else str(height)
+
+    def _cached(self, kind, key, fetch, cache=True, final=lambda value: True):
+        '''read through the block store, only explicit heights are stored'''
+        if self._store is None or not cache or key == 'latest':
+            return fetch()
+        value = self._store.get(kind, key)
+        if value is None:
+            value = fetch()
+            if final(value):
+                self._store.put(kind, key, value)
+        return value
+
+    def status(self, fresh=False):
+        '''node status, cached for STATUS_TTL seconds
+        :param fresh: Bypass the cache, [default: False]'''
+        if self._status_fresh(fresh):
+            return self._status
+        return self._set_status(self._rpc.call('status'))
 
     def info(self):
-        return call_chain('info')
+        return self._rpc.call('info')
 
     def genesis(self):
-        return call_chain('genesis')
+        return self._rpc.call('genesis')
 
     def unconfirmed_txs(self):
-        return call_chain('unconfirmed_txs')
+        return self._rpc.call('unconfirmed_txs')
+
+    def num_unconfirmed_txs(self):
+        return self._rpc.call('num_unconfirmed_txs')
 
     def latest_height(self):
         return self.status()['sync_info']['latest_block_height']
 
-    def validators(self, height='latest'):
-        height = height if height != 'latest' else self.latest_height()
-        return call_chain('validators', str(height))
+    def _height(self, height):
+        return height if height != 'latest' else self.latest_height()
 
-    def block(self, height='latest'):
-        height = height if height != 'latest' else self.latest_height()
-        return call_chain('block', str(height))
+    def validators(self, height='latest', cache=True):
+        return self._cached('validators', height, lambda: self._rpc.call(
+            'validators', self._at(height)), cache)
 
-    def block_results(self, height='latest'):
-        height = height if height != 'latest' else self.latest_height()
-        return call_chain('block_results', str(height))
+    def block(self, height='latest', cache=True):
+        ''':param cache: Read through the local block store if BLOCK_STORE is set, [default: True]'''
+        block = self._cached('block', height, lambda: self._rpc.call(
+            'block', self._at(height)), cache)
+        self._observe_height(block['block_meta']['header']['height'])
+        return block
 
-    def chain(self, min_height, max_height='latest'):
+    def block_results(self, height='latest', cache=True):
+        return self._cached('block_results', height, lambda: self._rpc.call(
+            'block_results', self._at(height)), cache)
+
+    def blocks(self, min_height, max_height='latest', batch_size=RPC_BATCH_SIZE):
+        '''blocks of a height range (inclusive) in batched requests'''
+        return self._range('block', min_height, max_height, batch_size)
+
+    def blocks_results(self, min_height, max_height='latest', batch_size=RPC_BATCH_SIZE):
+        '''block results of a height range (inclusive) in batched requests'''
+        return self._range('block_results', min_height, max_height, batch_size)
+
+    def _range(self, method, min_height, max_height, batch_size):
         max_height = max_height if max_height != 'latest' else self.latest_height()
-        return call_chain('blockchain', str(min_height), str(max_height))
+        return self._rpc.batch(
+            ((method, (str(height),)) for height in range(int(min_height), int(max_height) + 1)),
+            batch_size
+        )
 
-    def commit(self, height='latest'):
-        height = height if height != 'latest' else self.latest_height()
-        return call_chain('commit', str(height))
+    def chain(self, min_height, max_height='latest'):
+        # max height 0 is the latest one
+        return self._rpc.call('blockchain', str(min_height), self._at(max_height) or '0')
+
+    @staticmethod
+    def _pages(min_height, max_height, page_size):
+        for low in range(int(min_height), int(max_height) + 1, page_size):
+            yield low, min(low + page_size - 1, int(max_height))
+
+    @staticmethod
+    def _page_calls(low, high, results):
+        methods = ('block', 'block_results') if results else ('block',)
+        return [(method, (str(height),)) for height in range(low, high + 1) for method in methods]
+
+    @staticmethod
+    def _page_items(low, high, results, responses):
+        step = 2 if results else 1
+        for r in responses:
+            if isinstance(r, RPCError):
+                raise r
+        for i, height in enumerate(range(low, high + 1)):
+            item = {'height': height, 'block': responses[i * step]}
+            if results:
+                item['block_results'] = responses[i * step + 1]
+            yield item
+
+    def _fetch_page(self, low, high, results):
+        calls = self._page_calls(low, high, results)
+        return list(self._page_items(low, high, results, self._rpc.batch(calls, len(calls))))
+
+    def iter_blocks(self, min_height, max_height='latest', page_size=20, window=4, results=True):
+        '''Yield {"height", "block", "block_results"} in height order.
+
+        Each page of `page_size` heights is fetched in one batch request, `window`
+        pages are in flight at a time, so memory use doesn't grow with the range.'''
+        return self._pipeline(min_height, max_height, page_size, window,
+                              lambda low, high: self._fetch_page(low, high, results))
+
+    def _pipeline(self, min_height, max_height, page_size, window, fetch):
+        '''yield from fetch(low, high) of each page in order, `window` pages in flight'''
+        pending = collections.deque()
+        with ThreadPoolExecutor(window) as pool:
+            for low, high in self._pages(min_height, self._height(max_height), page_size):
+                pending.append(pool.submit(fetch, low, high))
+                if len(pending) >= window:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def scan(self, min_height=1, max_height='latest', page_size=20, window=4,
+             results=True, checkpoint=None, output=None):
+        '''Export blocks of a height range as NDJSON, one line per height
+        :param page_size: Heights fetched per batch request, [default: 20]
+        :param window: Number of pages fetched concurrently, [default: 4]
+        :param results: Include block_results, [default: True]
+        :param checkpoint: File recording the last exported height, the scan resumes after it
+        :param output: Output file, appended to, [default: stdout]'''
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as fp:
+                min_height = max(int(min_height), int(fp.read().strip() or 0) + 1)
+        out = open(output, 'a') if output else sys.stdout
+        last = None
+        try:
+            for item in self.iter_blocks(min_height, max_height, page_size, window, results):
+                out.write(json.dumps(item) + '\n')
+                last = item['height']
+                if checkpoint and last % page_size == 0:
+                    save_checkpoint(checkpoint, out, last)
+        finally:
+            if checkpoint and last is not None:
+                save_checkpoint(checkpoint, out, last)
+            if output:
+                out.close()
+
+    def _fetch_stats_page(self, low, high):
+        '''block of each height, with the validator set that signed its last commit'''
+        calls = []
+        for height in range(low, high + 1):
+            calls.append(('block', (str(height),)))
+            calls.append(('validators', (str(max(height - 1, 1)),)))
+        responses = self._rpc.batch(calls, len(calls))
+        for r in responses:
+            if isinstance(r, RPCError):
+                raise r
+        return [(responses[i], responses[i + 1]) for i in range(0, len(responses), 2)]
+
+    def stats(self, min_height=1, max_height='latest', chunk_size=10000, page_size=50,
+              window=4, rolling=100):
+        '''Block interval, txs and tx bytes per block, proposers and missed signatures of
+        a height range, computed with numpy.
+
+        The blocks are fetched and reduced to columns `chunk_size` heights at a time,
+        only the per block columns are kept for the whole range.
+        :param page_size: Heights fetched per batch request, [default: 50]
+        :param window: Number of pages fetched concurrently, [default: 4]
+        :param rolling: Blocks in the rolling windows of interval and tx rate, [default: 100]'''
+        import numpy as np
+        min_height = int(min_height)
+        max_height = int(self._height(max_height))
+        if min_height > max_height:
+            # empty range, or starting above the latest height
+            return json.dumps({'min_height': min_height, 'max_height': max_height, 'blocks': 0}, indent=4)
+        codes = {}  # validator address -> index into the counters
+        columns = {'time': [], 'txs': [], 'tx_bytes': [], 'proposer': []}
+        expected = np.zeros(0, dtype=np.int64)
+        missed = np.zeros(0, dtype=np.int64)
+
+        def code(address):
+            return codes.setdefault(address, len(codes))
+
+        def reduce_chunk(items):
+            nonlocal expected, missed
+            times, txs, tx_bytes, proposers, signers, signed = [], [], [], [], [], []
+            for block, validators in items:
+                header = block['block']['header']
+                times.append(header['time'].rstrip('Z'))
+                data = block['block']['data']['txs'] or []
+                txs.append(len(data))
+                tx_bytes.append(sum(len(tx) * 3 // 4 - tx.count('=') for tx in data))
+                proposers.append(code(header['proposer_address']))
+                if int(header['height']) > 1:
+                    # precommits are ordered as the validator set of the previous height
+                    precommits = block['block']['last_commit']['precommits']
+                    for validator, vote in zip(validators['validators'], precommits):
+                        signers.append(code(validator['address']))
+                        signed.append(vote is not None)
+            columns['time'].append(np.array(times, dtype='datetime64[ns]').astype(np.int64))
+            columns['txs'].append(np.array(txs, dtype=np.int32))
+            columns['tx_bytes'].append(np.array(tx_bytes, dtype=np.int64))
+            columns['proposer'].append(np.array(proposers, dtype=np.int32))
+            signers = np.array(signers, dtype=np.int64)
+            signed = np.array(signed, dtype=bool)
+            expected = np.pad(expected, (0, len(codes) - len(expected))) + \
+                np.bincount(signers, minlength=len(codes))
+            missed = np.pad(missed, (0, len(codes) - len(missed))) + \
+                np.bincount(signers[~signed], minlength=len(codes))
+
+        chunk = []
+        for item in self._pipeline(min_height, max_height, page_size, window, self._fetch_stats_page):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                reduce_chunk(chunk)
+                chunk = []
+        if chunk:
+            reduce_chunk(chunk)
+
+        times = np.concatenate(columns['time']) / 1e9
+        txs = np.concatenate(columns['txs'])
+        tx_bytes = np.concatenate(columns['tx_bytes'])
+        proposers = np.bincount(np.concatenate(columns['proposer']), minlength=len(codes))
+        intervals = np.diff(times)
+        addresses = sorted(codes, key=codes.get)
+        result = {
+            'min_height': min_height,
+            'max_height': max_height,
+            'blocks': len(txs),
+            'txs': int(txs.sum()),
+            'tps': float(txs[1:].sum() / (times[-1] - times[0])) if len(times) > 1 and times[-1] > times[0] else None,
+            'block_interval': array_percentiles(np, intervals),
+            'txs_per_block': array_percentiles(np, txs),
+            'tx_bytes_per_block': array_percentiles(np, tx_bytes),
+        }
+        if len(intervals) >= rolling:
+            # sums over every `rolling` consecutive blocks
+            interval = (times[rolling:] - times[:-rolling]) / rolling
+            window_txs = np.cumsum(np.concatenate(([0], txs[1:])))
+            window_txs = window_txs[rolling:] - window_txs[:-rolling]
+            rate = window_txs / np.maximum(times[rolling:] - times[:-rolling], 1e-9)
+            result['rolling'] = {
+                'window': rolling,
+                'block_interval': array_percentiles(np, interval, (50,), low=True),
+                'tps': array_percentiles(np, rate, (50,), low=True),
+            }
+        result['validators'] = [
+            {
+                'address': address,
+                'proposed': int(proposers[i]),
+                'expected_signatures': int(expected[i]) if i < len(expected) else 0,
+                'missed_signatures': int(missed[i]) if i < len(missed) else 0,
+            }
+            for i, address in enumerate(addresses)
+        ]
+        return json.dumps(result, indent=4)
+
+    def commit(self, height='latest', cache=True):
+        # the commit of the latest height is not canonical yet
+        return self._cached('commit', height, lambda: self._rpc.call(
+            'commit', self._at(height)), cache,
+            final=lambda value: value.get('canonical', False))
+
+    def follow(self, events='NewBlock', buffer=100):
+        '''Print chain events as NDJSON as they happen, over the websocket endpoint
+        :param events: Comma separated event types, [NewBlock|Tx] [default: NewBlock]
+        :param buffer: Events buffered before reading the websocket is paused, [default: 100]'''
+        async def run():
+            async with AsyncRPC(chain_url=self._rpc.url) as rpc:
+                async for event in rpc.chain.follow(events, buffer):
+                    print(json.dumps(event), flush=True)
+
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
+
+    def monitor(self, interval=1.0, duration=None, txs=None, rate=1.0, output=None):
+        '''Sample the mempool size as NDJSON, and track transactions to their inclusion
+        :param interval: Seconds between mempool samples, [default: 1]
+        :param duration: Seconds to run, [default: until interrupted, or all txs are tracked]
+        :param txs: File of encoded signed transactions, one per line, broadcasted with
+            broadcast_tx_sync, each is reported with its broadcast, mempool admission and
+            inclusion time.
+        :param rate: Transactions broadcasted per second, [default: 1]
+        :param output: Output file, [default: stdout]'''
+        lines = []
+        if txs:
+            with open(txs) as fp:
+                lines = [line.strip() for line in fp if line.strip()]
+
+        async def run(out):
+            async with AsyncRPC(chain_url=self._rpc.url) as rpc:
+                await monitor(rpc, out, interval, duration, lines, rate)
+
+        out = open(output, 'w') if output else sys.stdout
+        try:
+            asyncio.run(run(out))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if output:
+                out.close()
 
     def query(self, path, data, proof=False):
-        return call_chain('abci_query', path, data, proof)
+        return self._rpc.call('abci_query', path, data, proof)
 
     def broadcast_tx_commit(self, tx):
-        return call_chain('broadcast_tx_commit', tx)
+        return self._rpc.call('broadcast_tx_commit', tx)
 
     def broadcast_tx_sync(self, tx):
-        return call_chain('broadcast_tx_sync', tx)
+        return self._rpc.call('broadcast_tx_sync', tx)
 
     def broadcast_tx_async(self, tx):
-        return call_chain('broadcast_tx_async', tx)
-
-    def tx(self, txid):
-        return call_chain('tx', txid)
+        return self._rpc.call('broadcast_tx_async', tx)
+
+    def _stored_tx(self, txid):
+        '''(height, index, tx) of a tx included in a stored block, None if not stored'''
+        if self._store is None:
+            return None
+        height = self._store.tx_height(txid)
+        block = self._store.get('block', height) if height is not None else None
+        if block is None:
+            return None
+        for index, tx in enumerate(block['block']['data']['txs'] or []):
+            if hashlib.sha256(base64.b64decode(tx)).hexdigest().upper() == txid:
+                return height, index, tx
+
+    @staticmethod
+    def _tx_response(txid, stored, results):
+        '''the response of the tx endpoint for a tx of a stored block, without proof'''
+        height, index, tx = stored
+        return {
+            'hash': txid,
+            'height': str(height),
+            'index': index,
+            'tx_result': results['results']['deliver_tx'][index],
+            'tx': tx,
+        }
+
+    def tx(self, txid, cache=True):
+        '''tx by hash, in hex or base64, txs of stored blocks are served from the block store'''
+        txid = txid_hex(txid)
+        stored = self._stored_tx(txid) if cache else None
+        if stored is not None:
+            return self._tx_response(txid, stored, self.block_results(stored[0]))
+        return self._cached('tx', txid, lambda: self._rpc.call('tx', hash_param(txid)), cache)
+
+    def _stored_height(self, block_hash, cache):
+        if self._store is None or not cache:
+            return None
+        return self._store.block_height(block_hash)
+
+    def block_by_hash(self, block_hash, cache=True):
+        '''block by hash in hex, served from the block store if stored'''
+        height = self._stored_height(block_hash, cache)
+        if height is not None:
+            return self.block(height)
+        block = self._rpc.call('block_by_hash', hash_param(block_hash))
+        if self._store is not None and cache:
+            self._store.put('block', block['block']['header']['height'], block)
+        return block
 
 
 class RPC:
-    def __init__(self):
-        self.wallet = Wallet()
-        self.staking = Staking()
-        self.address = Address()
-        self.multisig = MultiSig()
-        self.chain = Blockchain()
+    def __init__(self, client=None, chain=None):
+        self._client = client or client_transport
+        self.wallet = Wallet(self._client)
+        self.staking = Staking(self._client)
+        self.address = Address(self._client)
+        self.multisig = MultiSig(self._client)
+        self.chain = Blockchain(chain, default_store())
+        self.bench = Bench()
+
+    def cluster(self, spec='cluster.json', host='127.0.0.1', timeout=5, output='table'):
+        '''Snapshot of every node of a chainbot cluster spec, queried concurrently
+        :param spec: Path of the cluster specification, [default: cluster.json]
+        :param host: Host the nodes run on, [default: 127.0.0.1]
+        :param output: [table|json] [default: table]'''
+        with open(spec) as fp:
+            nodes = json.load(fp)['nodes']
+        snapshot = asyncio.run(cluster_snapshot(nodes, host, timeout))
+        if output == 'json':
+            return json.dumps(snapshot, indent=4)
+        return format_snapshot(snapshot)
 
     def raw_tx(self, inputs, outputs, view_keys):
-        return call('transaction_createRaw', inputs, outputs, view_keys)
+        return self._client.call('transaction_createRaw', inputs, outputs, view_keys)
+
+    def serve(self, socket=None, pipeline=1):
+        '''Run NDJSON commands from stdin, or from the connections of a unix socket, over
+        the pooled connections of this process.
+
+        Input lines are {"id", "method": "chain.block", "args": [], "kwargs": {}},
+        output lines are {"id", "result"} or {"id", "error"}, in the order of the input.
+        :param socket: Path of the unix socket to listen on, [default: use stdin/stdout]
+        :param pipeline: Number of commands executed concurrently, [default: 1]'''
+        with ThreadPoolExecutor(pipeline) as pool:
+            if socket is None:
+                serve_lines(self, sys.stdin, sys.stdout, pool, pipeline)
+                return
+            import socketserver
+            rpc = self
+
+            class Handler(socketserver.StreamRequestHandler):
+                def handle(self):
+                    out = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+                    serve_lines(rpc, io.TextIOWrapper(self.rfile, encoding='utf-8'), out, pool, pipeline)
+
+            if os.path.exists(socket):
+                os.unlink(socket)
+            with socketserver.ThreadingUnixStreamServer(socket, Handler) as server:
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+
+
+def run_command(rpc, line):
+    '''execute a NDJSON command against rpc, returns the NDJSON response'''
+    id_ = None
+    try:
+        cmd = json.loads(line)
+        id_ = cmd.get('id')
+        target = rpc
+        for name in cmd['method'].split('.'):
+            if name.startswith('_'):
+                raise AttributeError('private attribute: %s' % name)
+            target = getattr(target, name)
+        result = target(*cmd.get('args', []), **cmd.get('kwargs', {}))
+        return json.dumps({'id': id_, 'result': result}, default=str)
+    except Exception as exc:
+        return json.dumps({'id': id_, 'error': '%s: %s' % (type(exc).__name__, exc)})
+
+
+def serve_lines(rpc, input, output, pool, pipeline=1):
+    '''run commands of `input` with up to `pipeline` in flight, a writer thread writes
+    the responses in order as soon as they're done'''
+    slots = threading.Semaphore(pipeline)
+    pending = queue.Queue()
+
+    def write():
+        broken = False
+        while True:
+            future = pending.get()
+            if future is None:
+                break
+            response = future.result()
+            if not broken:
+                try:
+                    output.write(response + '\n')
+                    output.flush()
+                except OSError:
+                    # client gone, keep draining so the reader isn't blocked
+                    broken = True
+            slots.release()
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    try:
+        for line in input:
+            if not line.strip():
+                continue
+            slots.acquire()
+            pending.put(pool.submit(run_command, rpc, line))
+    finally:
+        pending.put(None)
+        writer.join()
+
+
+async def node_snapshot(node, host, timeout):
+    # tendermint rpc port, see Port Usage in README
+    transport = AsyncTransport('http://%s:%d' % (host, node['base_port'] + 7), timeout)
+    t = time.perf_counter()
+    try:
+        status, net_info, validators, mempool = await transport.batch([
+            ('status', ()),
+            ('net_info', ()),
+            ('validators', (None,)),
+            ('num_unconfirmed_txs', ()),
+        ])
+        for r in (status, net_info, validators, mempool):
+            if isinstance(r, RPCError):
+                raise r
+        return {
+            'name': node['name'],
+            'height': int(status['sync_info']['latest_block_height']),
+            'catching_up': status['sync_info']['catching_up'],
+            'peers': int(net_info['n_peers']),
+            'validators': len(validators['validators']),
+            'mempool': int(mempool['n_txs']),
+            'latency_ms': round((time.perf_counter() - t) * 1000, 1),
+        }
+    except Exception as exc:
+        return {'name': node['name'], 'error': error_kind(exc)}
+    finally:
+        await transport.close()
+
+
+async def cluster_snapshot(nodes, host='127.0.0.1', timeout=5):
+    results = await asyncio.gather(*(node_snapshot(node, host, timeout) for node in nodes))
+    heights = [r['height'] for r in results if 'height' in r]
+    top = max(heights) if heights else None
+    for r in results:
+        if 'height' in r:
+            r['behind'] = top - r['height']
+    return {
+        'nodes': results,
+        'max_height': top,
+        'min_height': min(heights) if heights else None,
+        'divergence': top - min(heights) if heights else None,
+        'catching_up': [r['name'] for r in results if r.get('catching_up')],
+        'unreachable': [r['name'] for r in results if 'error' in r],
+    }
+
+
+def format_snapshot(snapshot):
+    columns = ('name', 'height', 'behind', 'catching_up', 'peers', 'validators', 'mempool', 'latency_ms')
+    lines = ['  '.join('%-12s' % c for c in columns)]
+    for r in snapshot['nodes']:
+        if 'error' in r:
+            lines.append('%-12s  %s' % (r['name'], r['error']))
+        else:
+            lines.append('  '.join('%-12s' % r[c] for c in columns))
+    lines.append('height: %s..%s divergence: %s catching up: %s unreachable: %s' % (
+        snapshot['min_height'], snapshot['max_height'], snapshot['divergence'],
+        ','.join(snapshot['catching_up']) or '-', ','.join(snapshot['unreachable']) or '-'))
+    return '\n'.join(lines)
+
+
+def blocking_only(name):
+    '''stands in for a blocking command on the asyncio classes'''
+    def method(self, *args, **kwargs):
+        raise TypeError('%s is a blocking command, not available on the asyncio API' % name)
+    return method
+
+
+class AsyncWallet(Wallet):
+    '''Wallet over an AsyncTransport, the rpc methods are coroutines'''
+    sync_many = blocking_only('Wallet.sync_many')
+
+
+class AsyncBlockchain(Blockchain):
+    '''Blockchain over an AsyncTransport, the rpc methods are coroutines,
+    iter_blocks and follow are async iterators'''
+    scan = blocking_only('Blockchain.scan')
+    stats = blocking_only('Blockchain.stats')
+    monitor = blocking_only('Blockchain.monitor')
+
+    async def status(self, fresh=False):
+        if self._status_fresh(fresh):
+            return self._status
+        return self._set_status(await self._rpc.call('status'))
+
+    async def latest_height(self):
+        return (await self.status())['sync_info']['latest_block_height']
+
+    async def _height(self, height):
+        return height if height != 'latest' else await self.latest_height()
+
+    async def _cached(self, kind, key, fetch, cache=True, final=lambda value: True):
+        if self._store is None or not cache or key == 'latest':
+            return await fetch()
+        value = self._store.get(kind, key)
+        if value is None:
+            value = await fetch()
+            if final(value):
+                self._store.put(kind, key, value)
+        return value
+
+    async def validators(self, height='latest', cache=True):
+        return await self._cached('validators', height, lambda: self._call_at('validators', height), cache)
+
+    async def block(self, height='latest', cache=True):
+        block = await self._cached('block', height, lambda: self._call_at('block', height), cache)
+        self._observe_height(block['block_meta']['header']['height'])
+        return block
+
+    async def block_results(self, height='latest', cache=True):
+        return await self._cached('block_results', height, lambda: self._call_at('block_results', height), cache)
+
+    async def _call_at(self, method, height):
+        return await self._rpc.call(method, self._at(height))
+
+    async def _range(self, method, min_height, max_height, batch_size):
+        max_height = await self._height(max_height)
+        return await self._rpc.batch(
+            ((method, (str(height),)) for height in range(int(min_height), int(max_height) + 1)),
+            batch_size
+        )
+
+    async def _fetch_page(self, low, high, results):
+        calls = self._page_calls(low, high, results)
+        return list(self._page_items(low, high, results, await self._rpc.batch(calls, len(calls))))
+
+    async def iter_blocks(self, min_height, max_height='latest', page_size=20, window=4, results=True):
+        '''Async generator version of Blockchain.iter_blocks'''
+        pending = collections.deque()
+        try:
+            for low, high in self._pages(min_height, await self._height(max_height), page_size):
+                pending.append(asyncio.ensure_future(self._fetch_page(low, high, results)))
+                if len(pending) >= window:
+                    for item in await pending.popleft():
+                        yield item
+            while pending:
+                for item in await pending.popleft():
+                    yield item
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+    async def follow(self, events='NewBlock', buffer=100, reconnect_delay=1):
+        '''Async iterator of NewBlock and Tx events subscribed over the websocket.
+
+        Yields {"type", "height", "data"}. Reading the websocket pauses while
+        `buffer` events are waiting to be consumed. After a reconnect, blocks
+        missed in between are fetched with block() and yielded with
+        "backfill": True, as well as their txs if Tx events are followed.'''
+        if isinstance(events, str):
+            events = events.split(',')
+        events = set(events)
+        queue = asyncio.Queue(buffer)
+        producer = asyncio.ensure_future(self._subscribe(events, queue, reconnect_delay))
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                await asyncio.wait([get, producer], return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    producer.result()  # raise the error that stopped the producer
+                yield get.result()
+        finally:
+            producer.cancel()
+
+    async def _subscribe(self, events, queue, reconnect_delay):
+        import aiohttp
+        last_height = None
+        while True:
+            try:
+                ws = await self._rpc.websocket()
+            except (OSError, aiohttp.ClientError):
+                await asyncio.sleep(reconnect_delay)
+                continue
+            try:
+                # NewBlock is always subscribed to detect gaps
+                for i, event in enumerate(sorted(events | {'NewBlock'})):
+                    await ws.send_json({
+                        'jsonrpc': '2.0', 'id': i, 'method': 'subscribe',
+                        'params': {'query': "tm.event='%s'" % event},
+                    })
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    rsp = json.loads(msg.data)
+                    if 'error' in rsp:
+                        # e.g. the subscription was cancelled for being too slow
+                        break
+                    data = rsp.get('result', {}).get('data')
+                    if not data:
+                        continue
+                    event = data['type'].rsplit('/', 1)[-1]
+                    if event == 'NewBlock':
+                        height = int(data['value']['block']['header']['height'])
+                        if last_height is not None:
+                            for missing in range(last_height + 1, height):
+                                await self._backfill(missing, events, queue)
+                        if last_height is not None and height <= last_height:
+                            continue
+                        last_height = height
+                    else:
+                        height = int(data['value']['TxResult']['height'])
+                    if event in events:
+                        await queue.put({'type': event, 'height': height, 'data': data['value']})
+            except (OSError, aiohttp.ClientError):
+                pass
+            finally:
+                await ws.close()
+            await asyncio.sleep(reconnect_delay)
+
+    async def _backfill(self, height, events, queue):
+        block = await self.block(height)
+        if 'NewBlock' in events:
+            await queue.put({'type': 'NewBlock', 'height': height, 'data': block, 'backfill': True})
+        if 'Tx' in events:
+            for tx in block['block']['data']['txs'] or []:
+                await queue.put({'type': 'Tx', 'height': height, 'data': {'tx': tx}, 'backfill': True})
+
+    async def chain(self, min_height, max_height='latest'):
+        return await self._rpc.call('blockchain', str(min_height), self._at(max_height) or '0')
+
+    async def commit(self, height='latest', cache=True):
+        return await self._cached('commit', height, lambda: self._call_at('commit', height), cache,
+                                  final=lambda value: value.get('canonical', False))
+
+    async def tx(self, txid, cache=True):
+        txid = txid_hex(txid)
+        stored = self._stored_tx(txid) if cache else None
+        if stored is not None:
+            return self._tx_response(txid, stored, await self.block_results(stored[0]))
+        return await self._cached('tx', txid, lambda: self._rpc.call('tx', hash_param(txid)), cache)
+
+    async def block_by_hash(self, block_hash, cache=True):
+        height = self._stored_height(block_hash, cache)
+        if height is not None:
+            return await self.block(height)
+        block = await self._rpc.call('block_by_hash', hash_param(block_hash))
+        if self._store is not None and cache:
+            self._store.put('block', block['block']['header']['height'], block)
+        return block
+
+
+class AsyncRPC(RPC):
+    '''asyncio mirror of RPC, the rpc methods return coroutines. The blocking commands
+    (cluster, serve, chain scan/stats/monitor, wallet sync_many) are not available.
+
+    At most `concurrency` requests are in flight per endpoint, so callers can
+    fan out with asyncio.gather freely::
+
+        async with AsyncRPC() as rpc:
+            blocks = await asyncio.gather(*(rpc.chain.block(h) for h in range(1, 1000)))
+    '''
+    def __init__(self, client_url=CLIENT_RPC_URL, chain_url=CHAIN_RPC_URL,
+                 concurrency=RPC_CONCURRENCY, timeout=RPC_TIMEOUT, store=None):
+        self._client = AsyncTransport(client_url, timeout, concurrency)
+        self._chain = AsyncTransport(chain_url, timeout, concurrency)
+        self.wallet = AsyncWallet(self._client)
+        self.staking = Staking(self._client)
+        self.address = Address(self._client)
+        self.multisig = MultiSig(self._client)
+        self.chain = AsyncBlockchain(self._chain, store or default_store())
+
+    cluster = blocking_only('RPC.cluster')
+    serve = blocking_only('RPC.serve')
+
+    async def close(self):
+        await self._client.close()
+        await self._chain.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {
+        'p%d' % p: values[min(len(values) - 1, len(values) * p // 100)]
+        for p in points
+    }
+    result['max'] = values[-1]
+    return result
+
+
+def array_percentiles(np, values, points=(50, 90, 99), low=False):
+    '''same as percentiles for a numpy array, with the min if low'''
+    if not len(values):
+        return {}
+    result = {
+        'p%d' % p: round(float(v), 6)
+        for p, v in zip(points, np.percentile(values, points))
+    }
+    if low:
+        result['min'] = round(float(values.min()), 6)
+    result['max'] = round(float(values.max()), 6)
+    return result
+
+
+def error_kind(exc):
+    if isinstance(exc, ReceivedErrorResponseError):
+        return 'rpc: %s' % exc.response.message
+    return type(exc).__name__
+
+
+def hash_param(hex_hash):
+    '''the `tx` and `block_by_hash` endpoints take the hash bytes, base64 encoded in json'''
+    return base64.b64encode(bytes.fromhex(hex_hash)).decode()
+
+
+def txid_hex(txid):
+    '''txid in upper case hex, from hex or the base64 encoded hash'''
+    if re.fullmatch(r'[0-9a-fA-F]{64}', txid):
+        return txid.upper()
+    return base64.b64decode(txid).hex().upper()
+
+
+async def wait_included(chain, txid, deadline, poll_interval=0.5):
+    '''poll `tx` until the tx is included, returns its height, None after the deadline (monotonic)'''
+    while time.monotonic() < deadline:
+        await asyncio.sleep(poll_interval)
+        try:
+            rsp = await chain.tx(txid, cache=False)
+        except ReceivedErrorResponseError:
+            continue  # not found yet
+        return int(rsp['height'])
+
+
+async def monitor(rpc, out, interval=1.0, duration=None, txs=(), rate=1.0,
+                  inclusion_timeout=60, poll_interval=0.5):
+    '''Write NDJSON samples of the mempool size every `interval` seconds, and the
+    timeline of each of `txs` broadcasted at `rate` per second.'''
+    def emit(record):
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+
+    async def sample():
+        while True:
+            t = time.time()
+            try:
+                rsp = await rpc.chain.num_unconfirmed_txs()
+                emit({'type': 'mempool', 't': t, 'n_txs': int(rsp['n_txs']),
+                      'total_bytes': int(rsp['total_bytes'])})
+            except Exception as exc:
+                emit({'type': 'mempool', 't': t, 'error': error_kind(exc)})
+            await asyncio.sleep(max(0, t + interval - time.time()))
+
+    async def track(tx):
+        record = {'type': 'tx', 'broadcast': time.time()}
+        t0 = time.monotonic()
+        try:
+            rsp = await rpc.chain.broadcast_tx_sync(tx)
+            record.update(txid=rsp['hash'], code=rsp.get('code', 0))
+            if not rsp.get('code'):
+                # admitted to the mempool once check_tx passed
+                record['mempool'] = time.time()
+                height = await wait_included(rpc.chain, rsp['hash'], t0 + inclusion_timeout, poll_interval)
+                if height is not None:
+                    record.update(height=height, included=time.time())
+                    record['latency'] = record['included'] - record['broadcast']
+        except Exception as exc:
+            record['error'] = error_kind(exc)
+        emit(record)
+
+    async def submit():
+        tracked = []
+        for i, tx in enumerate(txs):
+            await asyncio.sleep(max(0, start + i / rate - time.monotonic()))
+            tracked.append(asyncio.ensure_future(track(tx)))
+        await asyncio.gather(*tracked)
+
+    start = time.monotonic()
+    sampler = asyncio.ensure_future(sample())
+    tasks = [asyncio.ensure_future(submit())] if txs else []
+    if duration is not None:
+        tasks.append(asyncio.ensure_future(asyncio.sleep(duration)))
+    try:
+        if tasks:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED if duration is not None else asyncio.ALL_COMPLETED)
+        else:
+            await sampler
+    finally:
+        for task in tasks + [sampler]:
+            task.cancel()
+
+
+class BenchStats:
+    def __init__(self):
+        self.submit_latency = []
+        self.inclusion_latency = []
+        self.errors = collections.Counter()
+        self.started = time.monotonic()
+        self.last_submitted = None
+        self.last_included = None
+
+    def report(self):
+        duration = time.monotonic() - self.started
+        submitted = len(self.submit_latency)
+        report = {
+            'submitted': submitted,
+            'failed': sum(self.errors.values()),
+            'duration': round(duration, 3),
+            'submit_tps': round(submitted / (self.last_submitted - self.started), 2) if submitted else 0,
+            'submit_latency': percentiles(self.submit_latency),
+            'errors': dict(self.errors),
+        }
+        if self.inclusion_latency:
+            report.update({
+                'included': len(self.inclusion_latency),
+                'inclusion_tps': round(len(self.inclusion_latency) / (self.last_included - self.started), 2),
+                'inclusion_latency': percentiles(self.inclusion_latency),
+            })
+        return report
+
+
+async def drive(submit, count, rate=0, senders=10, chain=None, inclusion_timeout=60, poll_interval=0.5):
+    '''Call `submit(i)` for i in range(count) from `senders` concurrent workers.
+
+    `rate` caps the submissions per second, 0 for as fast as possible. `submit`
+    returns (txid, height), height is None if the tx is not known to be
+    included yet, it's then polled through `chain.tx` to measure the
+    inclusion latency.'''
+    stats = BenchStats()
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    pending = iter(range(count))
+    inclusions = []
+
+    async def track(txid, t0):
+        try:
+            if await wait_included(chain, txid, t0 + inclusion_timeout, poll_interval) is None:
+                stats.errors['inclusion: timeout'] += 1
+                return
+        except Exception as exc:
+            stats.errors['inclusion: %s' % error_kind(exc)] += 1
+            return
+        stats.last_included = time.monotonic()
+        stats.inclusion_latency.append(stats.last_included - t0)
+
+    async def sender():
+        for i in pending:
+            if rate:
+                await asyncio.sleep(max(0, start + i / rate - loop.time()))
+            t0 = time.monotonic()
+            try:
+                txid, height = await submit(i)
+            except Exception as exc:
+                stats.errors[error_kind(exc)] += 1
+                continue
+            stats.last_submitted = time.monotonic()
+            stats.submit_latency.append(stats.last_submitted - t0)
+            if chain is None or txid is None:
+                continue
+            if height is not None:
+                stats.last_included = time.monotonic()
+                stats.inclusion_latency.append(stats.last_included - t0)
+            else:
+                inclusions.append(asyncio.ensure_future(track(txid, t0)))
+
+    await asyncio.gather(*(sender() for _ in range(senders)))
+    await asyncio.gather(*inclusions)
+    return stats.report()
+
+
+def command_value(token):
+    '''python literal of a command line value, or the string itself, like fire'''
+    try:
+        return ast.literal_eval(token)
+    except (ValueError, SyntaxError):
+        return token
+
+
+def command_request(rpc, args):
+    '''the serve request of a command line: the method path is resolved on rpc like fire
+    does, the remaining tokens are its arguments'''
+    target = rpc
+    path = []
+    while args and not callable(target) and not args[0].startswith('--'):
+        if args[0].startswith('_') or not hasattr(target, args[0]):
+            raise ValueError('unknown command: %s' % ' '.join(path + [args[0]]))
+        target = getattr(target, args[0])
+        path.append(args[0])
+        args = args[1:]
+    if not callable(target):
+        raise ValueError('not a command: %s' % ' '.join(path))
+    positional, kwargs = [], {}
+    while args:
+        token, args = args[0], args[1:]
+        if token.startswith('--'):
+            name, sep, value = token[2:].partition('=')
+            if not sep:
+                if args and not args[0].startswith('--'):
+                    value, args = args[0], args[1:]
+                else:
+                    value = 'True'
+            kwargs[name.replace('-', '_')] = command_value(value)
+        else:
+            positional.append(command_value(token))
+    return {'method': '.'.join(path), 'args': positional, 'kwargs': kwargs}
+
+
+class CheckTxError(Exception):
+    pass
+
+
+class Bench:
+    '''Transaction throughput load generator'''
+    def send(self, to_address, amount, count=100, rate=0, senders=10, inclusion=True,
+             name=DEFAULT_WALLET, poll_interval=0.5):
+        '''Benchmark wallet_sendToAddress
+        :param count: Number of transactions, [default: 100]
+        :param rate: Target transactions per second, 0 for maximum rate, [default: 0]
+        :param senders: Concurrent senders, [default: 10]
+        :param inclusion: Poll `tx` to measure inclusion latency, [default: True]
+        :param poll_interval: Seconds between `tx` polls, the resolution of the inclusion latency, [default: 0.5]'''
+        # ask the passphrase before the senders start
+        sessions.credentials(name)
+
+        async def run(rpc):
+            async def submit(i):
+                return await rpc.wallet.send(to_address, amount, name), None
+            return await drive(submit, count, rate, senders, rpc.chain if inclusion else None,
+                               poll_interval=poll_interval)
+
+        return self._run(run)
+
+    def broadcast(self, txs, mode='sync', count=None, rate=0, senders=10, inclusion=True,
+                  poll_interval=0.5):
+        '''Benchmark broadcast_tx_async/sync/commit
+        :param txs: File of transactions, one per line, either an encoded signed
+            transaction, or a json object of transaction_createRaw arguments
+            {"inputs", "outputs", "view_keys"} to create it first.
+        :param mode: [async|sync|commit] [default: sync]
+        :param count: Number of transactions, [default: all of the file]
+        :param rate: Target transactions per second, 0 for maximum rate, [default: 0]
+        :param senders: Concurrent senders, [default: 10]
+        :param inclusion: Poll `tx` to measure inclusion latency, [default: True]
+        :param poll_interval: Seconds between `tx` polls, the resolution of the inclusion latency, [default: 0.5]'''
+        with open(txs) as fp:
+            lines = [line.strip() for line in fp if line.strip()]
+        count = min(count or len(lines), len(lines))
+
+        async def run(rpc):
+            async def submit(i):
+                tx = lines[i]
+                if tx.startswith('{'):
+                    args = json.loads(tx)
+                    tx = await rpc.raw_tx(args['inputs'], args['outputs'], args.get('view_keys', []))
+                rsp = await getattr(rpc.chain, 'broadcast_tx_' + mode)(tx)
+                if mode == 'commit':
+                    for phase in ('check_tx', 'deliver_tx'):
+                        if rsp[phase].get('code'):
+                            raise CheckTxError('%s code %s' % (phase, rsp[phase]['code']))
+                    return rsp['hash'], rsp['height']
+                if rsp.get('code'):
+                    raise CheckTxError('check_tx code %s' % rsp['code'])
+                return rsp['hash'], None
+            return await drive(submit, count, rate, senders, rpc.chain if inclusion else None,
+                               poll_interval=poll_interval)
+
+        return self._run(run)
+
+    def daemon(self, command='chain status', count=100, pipeline=1):
+        '''Compare running a command `count` times as separate processes with
+        running it through a single `serve` process.
+        :param command: Command line, [default: chain status]
+        :param pipeline: Pipelining of the serve process, [default: 1]'''
+        args = shlex.split(command)
+        line = json.dumps(command_request(RPC(), args)) + '\n'
+        script = os.path.abspath(__file__)
+
+        t = time.monotonic()
+        for _ in range(count):
+            subprocess.run([sys.executable, script] + args, check=True,
+                           stdout=subprocess.DEVNULL)
+        processes = time.monotonic() - t
+
+        t = time.monotonic()
+        rsp = subprocess.run([sys.executable, script, 'serve', '--pipeline', str(pipeline)],
+                             input=(line * count).encode(), check=True, stdout=subprocess.PIPE)
+        daemon = time.monotonic() - t
+        for output in rsp.stdout.decode().splitlines():
+            error = json.loads(output).get('error')
+            if error:
+                raise RuntimeError('serve failed the command: %s' % error)
+        return json.dumps({
+            'count': count,
+            'processes': {'total': round(processes, 3), 'per_call': round(processes / count, 5)},
+            'serve': {'total': round(daemon, 3), 'per_call': round(daemon / count, 5)},
+            'speedup': round(processes / daemon, 1),
+        }, indent=4)
+
+    def _run(self, run):
+        async def main():
+            async with AsyncRPC() as rpc:
+                return await run(rpc)
+        return json.dumps(asyncio.run(main()), indent=4)
+
+    def stub(self, port=26657, block_time=1.0):
+        '''Serve a stub node answering the json-rpc methods used by the benchmarks,
+        point CLIENT_RPC_URL and CHAIN_RPC_URL to it to test the tooling.
+        :param block_time: Seconds between stub blocks, txs are included in the next one.'''
+        serve_stub(port, block_time)
+
+
+def serve_stub(port, block_time=1.0):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    started = time.time()
+    txs = {}  # hash -> submission time
+    lock = threading.Lock()
+
+    def height(t=None):
+        return int(((t or time.time()) - started) / block_time) + 1
+
+    def submit(tx):
+        txid = hashlib.sha256(str(tx).encode()).hexdigest().upper()
+        with lock:
+            txs[txid] = time.time()
+        return txid
+
+    def handle(method, params):
+        if method == 'status':
+            return {'sync_info': {'latest_block_height': str(height()), 'catching_up': False}}
+        elif method == 'wallet_sendToAddress':
+            return submit(params).lower()
+        elif method == 'transaction_createRaw':
+            return base64.b64encode(json.dumps(params).encode()).decode()
+        elif method in ('broadcast_tx_async', 'broadcast_tx_sync'):
+            return {'code': 0, 'data': '', 'log': '', 'hash': submit(params[0])}
+        elif method == 'broadcast_tx_commit':
+            txid = submit(params[0])
+            time.sleep(block_time)
+            return {'check_tx': {}, 'deliver_tx': {}, 'hash': txid, 'height': str(height())}
+        elif method == 'tx':
+            txid = base64.b64decode(params[0]).hex().upper()
+            included = txs.get(txid)
+            if included is None or height(included) >= height():
+                raise KeyError('Tx (%s) not found' % txid)
+            return {'hash': txid, 'height': str(height(included) + 1), 'tx_result': {}}
+        elif method in ('unconfirmed_txs', 'num_unconfirmed_txs'):
+            with lock:
+                n = sum(1 for t in txs.values() if height(t) >= height())
+            return {'n_txs': str(n), 'total': str(n), 'total_bytes': str(n * 100), 'txs': None}
+        raise KeyError('Method not found')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            out = [self.respond(r) for r in body] if isinstance(body, list) else self.respond(body)
+            data = json.dumps(out).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def respond(self, req):
+            try:
+                return {'jsonrpc': '2.0', 'id': req['id'],
+                        'result': handle(req['method'], req.get('params') or [])}
+            except KeyError as exc:
+                return {'jsonrpc': '2.0', 'id': req['id'],
+                        'error': {'code': -32603, 'message': 'Internal error', 'data': exc.args[0]}}
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 1024
+
+    Server(('127.0.0.1', port), Handler).serve_forever()
+
+
+def pop_option(argv, name, takes_value=lambda value: True):
+    '''remove `--name`, `--name=value` or `--name value` from argv, returns True, the
+    value or None. The next item is taken as the value unless it's an option or
+    takes_value(item) is false.'''
+    for i, arg in enumerate(argv):
+        if arg == name:
+            del argv[i]
+            if i < len(argv) and not argv[i].startswith('--') and takes_value(argv[i]):
+                return argv.pop(i)
+            return True
+        if arg.startswith(name + '='):
+            del argv[i]
+            return arg.split('=', 1)[1]
+    return None
+
+
+def setup_metrics(argv, rpc):
+    '''handle the global `--metrics [path]` and `--metrics_port port` options'''
+    # in `--metrics chain status` the command follows the flag, it's not a path
+    dump = pop_option(argv, '--metrics', lambda value: not hasattr(rpc, value))
+    port = pop_option(argv, '--metrics_port')
+    if port is True or port is not None and not port.isdigit():
+        sys.exit('--metrics_port takes a port number')
+    if not dump and not port:
+        return
+    metrics = Metrics()
+    HOOKS.append(metrics)
+    if port:
+        metrics.serve(int(port))
+    if dump:
+        def write():
+            summary = json.dumps(metrics.summary(), indent=4)
+            if dump is True:
+                print(summary, file=sys.stderr)
+            else:
+                with open(dump, 'w') as fp:
+                    fp.write(summary)
+        atexit.register(write)
 
 
 if __name__ == '__main__':
-    fire.Fire(RPC())
+    rpc = RPC()
+    setup_metrics(sys.argv, rpc)
+    fire.Fire(rpc)
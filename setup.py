@@ -14,8 +14,12 @@ setup(
         'fire==0.2.1',
         'mnemonic==0.19',
         'jsonpatch==1.24',
-        'jsonrpcclient[requests]',
+        'jsonrpcclient[requests]>=3.3,<4',
     ],
+    extras_require={
+        'async': ['aiohttp>=3.0'],
+        'stats': ['numpy'],
+    },
     scripts=[
         'chainbot.py',
         'chainrpc.py',